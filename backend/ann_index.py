@@ -0,0 +1,124 @@
+import os
+import time
+import faiss
+import numpy as np
+
+# --- Config ---
+# Query-time knobs for approximate indexes (ignored by the flat index). Live searches and
+# the precomputed neighbour table both use them, so the two agree.
+NPROBE = int(os.getenv("FAISS_NPROBE", 16))
+EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 64))
+
+# Index types selectable in precompute_embeddings.py --index-type; all use inner product
+# over L2-normalized vectors, i.e. cosine similarity, like the original IndexFlatIP.
+INDEX_TYPES = ["flat", "ivf-flat", "ivf-pq", "hnsw"]
+
+# Every index is labelled with catalog row numbers so incremental builds can append rows
+# and drop tombstoned ones without renumbering: IVF indexes carry the labels natively,
+# flat and HNSW indexes are wrapped in an IndexIDMap2.
+
+
+def build_index(vectors, index_type="flat", nlist=1024, pq_m=16, pq_bits=8, hnsw_m=32, ef_construction=200):
+    dim = vectors.shape[1]
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type in ("ivf-flat", "ivf-pq"):
+        # Keep at least ~39 training points per list, as FAISS recommends
+        nlist = max(1, min(nlist, len(vectors) // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf-flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    if isinstance(index, faiss.IndexIVF):
+        # Lets model.stored_vector() fall back to index.reconstruct(), and supports removal
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        index = faiss.IndexIDMap2(index)
+
+    add_rows(index, vectors, np.arange(len(vectors)))
+    return index
+
+
+def base_index(index):
+    """The underlying index of an IndexIDMap2 wrapper (or the index itself), downcast"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def add_rows(index, vectors, rows):
+    index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), np.asarray(rows, dtype="int64"))
+
+
+def remove_rows(index, rows):
+    """Drop rows from the index where FAISS supports it; returns False for HNSW, which
+    can't remove, so its tombstoned rows are only masked at query time"""
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return False
+    rows = np.ascontiguousarray(rows, dtype="int64")
+    if isinstance(base, faiss.IndexIVF):
+        # The hashtable direct map only accepts an explicit id array
+        index.remove_ids(faiss.IDSelectorArray(len(rows), faiss.swig_ptr(rows)))
+    else:
+        index.remove_ids(faiss.IDSelectorBatch(rows))
+    return True
+
+
+def search_params(index, nprobe=None, ef_search=None):
+    """Per-call FAISS search parameters, so concurrent searches don't share mutable index state"""
+    base = base_index(index)
+    if nprobe is not None and isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search is not None and isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def search(index, query_vecs, top_k, nprobe=None, ef_search=None):
+    params = search_params(index, nprobe=nprobe, ef_search=ef_search)
+    if params is None:
+        return index.search(query_vecs, top_k)
+    return index.search(query_vecs, top_k, params=params)
+
+
+def recall_report(index, vectors, top_k=50, num_queries=1000, knobs=None, seed=0):
+    """Recall@k and per-query latency of `index` against exact flat search, for each query-time knob value"""
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    queries = np.ascontiguousarray(vectors[sample])
+
+    flat = faiss.IndexFlatIP(vectors.shape[1])
+    flat.add(vectors)
+    start = time.perf_counter()
+    _, truth = flat.search(queries, top_k)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    report = [{"config": "flat", "recall": 1.0, "ms_per_query": flat_ms}]
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        knob = "nprobe"
+        values = knobs or [v for v in (1, 4, 8, 16, 32, 64, 128) if v <= base.nlist]
+    elif isinstance(base, faiss.IndexHNSW):
+        knob = "ef_search"
+        values = knobs or [16, 32, 64, 128, 256]
+    else:
+        return report
+
+    for value in values:
+        start = time.perf_counter()
+        _, found = search(index, queries, top_k, **{knob: value})
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(set(f) & set(t)) / top_k for f, t in zip(found, truth)])
+        report.append({"config": f"{knob}={value}", "recall": float(recall), "ms_per_query": ms})
+    return report
@@ -0,0 +1,59 @@
+import time
+import json
+import argparse
+import faiss
+import numpy as np
+import pandas as pd
+from embeddings import BACKENDS, get_backend, live_paths
+
+# Compares embedding backends on catalog movies: throughput, single-query latency,
+# and how much their top-k recommendations agree (each backend searches its own index).
+
+parser = argparse.ArgumentParser(description="Benchmark embedding backends against each other")
+parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS), default=sorted(BACKENDS))
+parser.add_argument("--samples", type=int, default=200)
+parser.add_argument("--top-k", type=int, default=10)
+args = parser.parse_args()
+
+alpha, beta = 0.6, 0.4
+
+with open("movies_precomputed.json", "r") as f:
+    movies = pd.DataFrame.from_dict(json.load(f), orient="index")
+
+sample = movies.sample(n=min(args.samples, len(movies)), random_state=0)
+overview_texts = sample["overview"].fillna("No overview available").astype(str).tolist()
+feature_texts = [
+    f"Genres: {row['genres']}. Cast: {row['cast']}. Director: {row['director']}."
+    for _, row in sample.iterrows()
+]
+
+results = {}
+for name in args.backends:
+    backend = get_backend(name)
+
+    start = time.perf_counter()
+    overview_vecs = backend.embed(overview_texts)
+    feature_vecs = backend.embed(feature_texts)
+    batch_seconds = time.perf_counter() - start
+
+    latencies = []
+    for overview, feature in list(zip(overview_texts, feature_texts))[:20]:
+        start = time.perf_counter()
+        backend.embed([overview, feature])
+        latencies.append(time.perf_counter() - start)
+
+    query_vecs = (alpha * overview_vecs + beta * feature_vecs).astype("float32")
+    faiss.normalize_L2(query_vecs)
+    index = faiss.read_index(live_paths(name)[0])
+    _, indices = index.search(query_vecs, args.top_k)
+    results[name] = indices
+
+    print(f"🔹 {backend.model_name}")
+    print(f"   throughput: {2 * len(sample) / batch_seconds:.1f} texts/s")
+    print(f"   query latency p50: {np.percentile(latencies, 50) * 1000:.1f} ms, p95: {np.percentile(latencies, 95) * 1000:.1f} ms")
+
+names = list(results)
+for i, a in enumerate(names):
+    for b in names[i + 1 :]:
+        overlap = np.mean([len(set(x) & set(y)) / args.top_k for x, y in zip(results[a], results[b])])
+        print(f"🔸 top-{args.top_k} overlap {a} vs {b}: {overlap:.2%}")
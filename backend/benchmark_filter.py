@@ -0,0 +1,70 @@
+import time
+import random
+import argparse
+from content_filter import DEFAULT_KEYWORDS, ContentFilter
+
+# Compares the compiled content filter with the per-keyword substring scan /genre_sort
+# used to do, on synthetic TMDB-shaped result batches.
+
+parser = argparse.ArgumentParser(description="Benchmark the /genre_sort content filter")
+parser.add_argument("--movies", type=int, default=100_000)
+parser.add_argument("--overview-words", type=int, default=60)
+parser.add_argument("--blocked-rate", type=float, default=0.02)
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--extra-keywords", type=int, nargs="+", default=[0, 100, 1000],
+                    help="Synthetic keywords added to the default list, one run per size")
+args = parser.parse_args()
+
+rng = random.Random(0)
+vocabulary = [
+    "a", "the", "young", "detective", "family", "war", "journey", "secret", "city", "love", "finds",
+    "must", "his", "her", "world", "after", "struggles", "escape", "friends", "mysterious", "town",
+]
+
+
+def synthetic_movie(i):
+    words = [rng.choice(vocabulary) for _ in range(args.overview_words)]
+    if rng.random() < args.blocked_rate:
+        words[rng.randrange(len(words))] = rng.choice(DEFAULT_KEYWORDS)
+    return {
+        "id": i,
+        "title": " ".join(rng.choice(vocabulary) for _ in range(3)).title(),
+        "overview": " ".join(words),
+        "poster_path": "/poster.jpg",
+        "original_language": rng.choice(["en", "en", "en", "fr"]),
+        "adult": False,
+    }
+
+
+def synthetic_keyword():
+    return "".join(rng.choice("bcdfghjklmnpqrstvwxz") for _ in range(rng.randint(5, 9)))
+
+
+def substring_filter(movies, bad_keywords):
+    kept = []
+    for movie in movies:
+        title_lower = (movie.get("title") or "").lower()
+        overview_lower = (movie.get("overview") or "").lower()
+        if (movie.get("poster_path")) and (not movie.get("adult")) and not any(k in title_lower or k in overview_lower for k in bad_keywords) and (movie.get("original_language") in ["en"]):
+            kept.append(movie)
+    return kept
+
+
+def best_of(fn, movies):
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        kept = fn(movies)
+        timings.append(time.perf_counter() - start)
+    return min(timings), kept
+
+
+movies = [synthetic_movie(i) for i in range(args.movies)]
+
+for extra in args.extra_keywords:
+    keywords = DEFAULT_KEYWORDS + [synthetic_keyword() for _ in range(extra)]
+    compiled = ContentFilter(keywords=keywords, languages=["en"])
+    print(f"🔸 {len(keywords)} keywords")
+    for name, fn in [("substring scan", lambda m: substring_filter(m, keywords)), ("compiled regex", compiled.apply)]:
+        seconds, kept = best_of(fn, movies)
+        print(f"   {name}: {len(movies) / seconds:,.0f} movies/s ({seconds * 1000:.1f} ms), kept {len(kept)}")
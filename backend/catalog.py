@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import numpy as np
+
+# Columnar movie catalog: each string column is a `<name>.offsets.npy` int64 array of
+# n + 1 byte offsets plus a `<name>.blob` of concatenated UTF-8, both memory-mapped, so
+# row lookups are a slice and gunicorn workers share the same page-cache pages.
+COLUMNS = ["id", "title", "overview", "genres", "cast", "director"]
+
+
+def _to_text(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, np.generic):
+        value = value.item()
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+
+def _encode(values):
+    encoded = [_to_text(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype="uint8")
+
+
+class StringColumn:
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def take(self, rows):
+        return [self[i] for i in rows]
+
+
+class Catalog:
+    def __init__(self, path=None, columns=None):
+        self.path = path
+        self.columns = columns or {}
+
+    @classmethod
+    def open(cls, path):
+        return cls(path=path)
+
+    @classmethod
+    def from_records(cls, records):
+        """In-memory catalog from a list of row dicts, for when no catalog directory exists"""
+        columns = {}
+        for name in COLUMNS:
+            columns[name] = StringColumn(*_encode([r.get(name) for r in records]))
+        return cls(columns=columns)
+
+    def column(self, name):
+        if name not in self.columns:
+            base = os.path.join(self.path, name)
+            offsets = np.load(f"{base}.offsets.npy", mmap_mode="r")
+            blob = np.memmap(f"{base}.blob", dtype="uint8", mode="r") if offsets[-1] else np.zeros(0, dtype="uint8")
+            self.columns[name] = StringColumn(offsets, blob)
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.column("title"))
+
+    def title(self, i):
+        return self.column("title")[i]
+
+    def row(self, i):
+        return {name: self.column(name)[i] for name in COLUMNS}
+
+
+def write_catalog(path, records):
+    """Write row dicts (in index row order) as a memory-mappable catalog directory"""
+    os.makedirs(path, exist_ok=True)
+    for name in COLUMNS:
+        offsets, blob = _encode([r.get(name) for r in records])
+        np.save(os.path.join(path, f"{name}.offsets.npy"), offsets)
+        blob.tofile(os.path.join(path, f"{name}.blob"))
+
+
+def records_from_json(json_path):
+    """Rows of a movies_precomputed.json file in index order; the dataset key is the fallback id"""
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    return [{**movie, "id": movie.get("id", key)} for key, movie in data.items()]
+
+
+if __name__ == "__main__":
+    # Convert an existing movies_precomputed.json without re-running the embedding build
+    src = sys.argv[1] if len(sys.argv) > 1 else "movies_precomputed.json"
+    dst = sys.argv[2] if len(sys.argv) > 2 else "movie_catalog"
+    write_catalog(dst, records_from_json(src))
+    print(f"✅ Wrote {dst} from {src}")
@@ -0,0 +1,78 @@
+import os
+import re
+
+# --- Config ---
+DEFAULT_KEYWORDS = [
+    "sex", "sexual", "seduce", "seduction", "paedophilia", "pedo", "porn", "xxx", "erotic", "adult",
+    "stepparent", "stepmom", "stepdad",
+]
+KEYWORDS = [k.strip() for k in os.getenv("CONTENT_FILTER_KEYWORDS", ",".join(DEFAULT_KEYWORDS)).split(",") if k.strip()]
+LANGUAGES = [l.strip() for l in os.getenv("CONTENT_FILTER_LANGUAGES", "en").split(",") if l.strip()]
+ALLOW_ADULT = os.getenv("CONTENT_FILTER_ALLOW_ADULT", "false").lower() in ("1", "true", "yes")
+
+
+def _trie_pattern(node):
+    alternatives = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not alternatives:
+        return ""
+    body = alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+    return f"(?:{body})?" if "" in node else body
+
+
+def compile_keywords(keywords):
+    """One prefix-factored alternation over lowercased keywords (sex|sexual -> sex(?:ual)?).
+
+    Sharing prefixes keeps the regex from re-trying every keyword at every position.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword.lower():
+            node = node.setdefault(ch, {})
+        node[""] = True
+    return re.compile(_trie_pattern(trie)) if trie else None
+
+
+class ContentFilter:
+    """Keyword, language, adult-flag and poster policy for TMDB-shaped movie dicts"""
+
+    def __init__(self, keywords=KEYWORDS, languages=LANGUAGES, allow_adult=ALLOW_ADULT, require_poster=True):
+        self.pattern = compile_keywords(keywords)
+        self.languages = frozenset(languages) if languages else None
+        self.allow_adult = allow_adult
+        self.require_poster = require_poster
+
+    def blocked_text(self, text):
+        """True if a keyword starts a word in text, so "sexy" is blocked but "Essex" isn't.
+
+        The word-start check runs only on (rare) raw matches; a \\b in the pattern itself
+        makes every scan slower.
+        """
+        if self.pattern is None:
+            return False
+        text = text.lower()
+        for match in self.pattern.finditer(text):
+            start = match.start()
+            if start == 0 or not text[start - 1].isalnum():
+                return True
+        return False
+
+    def allows(self, movie):
+        if self.require_poster and not movie.get("poster_path"):
+            return False
+        if not self.allow_adult and movie.get("adult"):
+            return False
+        if self.languages is not None and movie.get("original_language") not in self.languages:
+            return False
+        # Title and overview in one scan; the newline keeps a match from spanning both
+        text = f"{movie.get('title') or ''}\n{movie.get('overview') or ''}"
+        return not self.blocked_text(text)
+
+    def apply(self, movies):
+        return [movie for movie in movies if self.allows(movie)]
+
+
+default_filter = ContentFilter()
+
+# Catalog rows only carry title and overview, so recommendations get the keyword policy alone
+catalog_filter = ContentFilter(languages=None, allow_adult=True, require_poster=False)
@@ -1,6 +1,8 @@
-import psycopg2
+import time
+from contextlib import asynccontextmanager
 import boto3
-from urllib.parse import urlparse
+from psycopg import AsyncClientCursor
+from psycopg_pool import AsyncConnectionPool
 import os
 from dotenv import load_dotenv
 
@@ -8,22 +10,77 @@ load_dotenv()
 
 # PostgreSQL
 DATABASE_URL = os.getenv("DATABASE_URL")
-url = urlparse(DATABASE_URL) # Parse the database URL
-
-# Establish the connection
-conn = psycopg2.connect(
-    dbname=url.path[1:],
-    user=url.username,
-    password=url.password, 
-    host=url.hostname,
-    port=url.port
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 2))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10.0))
+
+# Opened in the app lifespan; client-side cursors keep psycopg2's parameter binding
+pool = AsyncConnectionPool(
+    DATABASE_URL,
+    min_size=DB_POOL_MIN,
+    max_size=DB_POOL_MAX,
+    timeout=DB_POOL_TIMEOUT,
+    max_idle=300,
+    max_lifetime=3600,
+    check=AsyncConnectionPool.check_connection,
+    kwargs={"cursor_factory": AsyncClientCursor},
+    open=False,
 )
 
+checkouts = {"count": 0, "wait_total_ms": 0.0, "wait_max_ms": 0.0, "in_use": 0}
+
+
+async def open_pool():
+    await pool.open(wait=True)
+
+
+async def close_pool():
+    await pool.close()
+
+
+@asynccontextmanager
+async def connection():
+    """A pooled connection held only for the block: endpoints that also hash passwords or
+    call S3 wrap just their SQL in it, so slow executor work doesn't hold a connection"""
+    start = time.perf_counter()
+    async with pool.connection() as conn:
+        waited = (time.perf_counter() - start) * 1000
+        checkouts["count"] += 1
+        checkouts["wait_total_ms"] += waited
+        checkouts["wait_max_ms"] = max(checkouts["wait_max_ms"], waited)
+        checkouts["in_use"] += 1
+        try:
+            yield conn
+        finally:
+            checkouts["in_use"] -= 1
+
+
+async def get_conn():
+    """FastAPI dependency: one pooled connection per request, returned to the pool afterwards"""
+    async with connection() as conn:
+        yield conn
+
+
+def pool_stats():
+    count = checkouts["count"]
+    return {
+        **pool.get_stats(),
+        "min_size": pool.min_size,
+        "max_size": pool.max_size,
+        "checkouts": count,
+        "checked_out": checkouts["in_use"],
+        "wait_avg_ms": checkouts["wait_total_ms"] / count if count else 0.0,
+        "wait_max_ms": checkouts["wait_max_ms"],
+    }
+
 # AWS S3
+# Set S3_ENDPOINT_URL to point at a local S3 stand-in such as MinIO
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
 s3 = boto3.client(
     "s3",
     aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_REGION")
+    region_name=os.getenv("AWS_REGION"),
+    endpoint_url=S3_ENDPOINT_URL
 )
-BUCKET = os.getenv("S3_BUCKET_NAME")
\ No newline at end of file
+BUCKET = os.getenv("S3_BUCKET_NAME")
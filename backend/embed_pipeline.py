@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import random
+import asyncio
+import numpy as np
+from tqdm import tqdm
+from embedding_cache import EmbeddingCache, content_key
+
+# --- Config ---
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))
+EMBED_RPM = int(os.getenv("EMBED_RPM", 3000))
+EMBED_TPM = int(os.getenv("EMBED_TPM", 1_000_000))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 100))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", 100_000))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 8))
+CHECKPOINT_PATH = os.getenv("EMBED_CHECKPOINT_PATH", "embedding_checkpoint.sqlite3")
+QUARANTINE_PATH = os.getenv("EMBED_QUARANTINE_PATH", "embedding_quarantine.jsonl")
+
+# Statuses worth retrying with backoff; 400/413/422 mean the input itself is bad
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+BAD_INPUT_STATUSES = {400, 413, 422}
+MAX_BACKOFF = 60.0
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English; only used for budgeting, so no tokenizer needed
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Refills `per_minute` units evenly over a minute; take() waits until enough are available"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, amount):
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.available >= amount:
+                self.available -= amount
+                return
+            await asyncio.sleep((amount - self.available) / self.rate)
+
+
+class RateLimiter:
+    """Requests- and tokens-per-minute budgets shared by all workers, plus a global pause on 429s"""
+
+    def __init__(self, rpm=EMBED_RPM, tpm=EMBED_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.lock = asyncio.Lock()
+        self.paused_until = 0.0
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens):
+        # One waiter at a time, so budgets are handed out in arrival order
+        async with self.lock:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.requests.take(1)
+            await self.tokens.take(tokens)
+
+
+class FatalEmbeddingError(Exception):
+    """Retries exhausted or a non-retryable API error (e.g. bad credentials): stop the run"""
+
+
+def _status(error):
+    return getattr(error, "status_code", None)
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_bad_input(error):
+    status = _status(error)
+    return status in BAD_INPUT_STATUSES or (status is None and isinstance(error, (ValueError, TypeError)))
+
+
+def _is_retryable(error):
+    status = _status(error)
+    # No status means the request never got an answer (connection reset, timeout)
+    return status in RETRY_STATUSES or (status is None and not _is_bad_input(error))
+
+
+class EmbeddingPipeline:
+    """Embeds texts with several concurrent batches under rate budgets.
+
+    Every finished batch is written to a checkpoint store keyed by content hash, so a
+    rerun after a crash only embeds what's missing. Items the API rejects on their own
+    are appended to a quarantine file and skipped instead of failing the run.
+    """
+
+    def __init__(
+        self,
+        backend,
+        concurrency=EMBED_CONCURRENCY,
+        limiter=None,
+        batch_size=EMBED_BATCH_SIZE,
+        batch_tokens=EMBED_BATCH_TOKENS,
+        max_retries=EMBED_MAX_RETRIES,
+        checkpoint_path=CHECKPOINT_PATH,
+        quarantine_path=QUARANTINE_PATH,
+    ):
+        self.backend = backend
+        self.concurrency = concurrency
+        self.limiter = limiter or RateLimiter()
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.max_retries = max_retries
+        self.checkpoint = EmbeddingCache(path=checkpoint_path, memory_size=0, max_entries=None)
+        self.quarantine_path = quarantine_path
+        self.quarantined = self._load_quarantine()
+        self.counters = {"requests": 0, "retries": 0, "rate_limited": 0, "splits": 0, "quarantined": 0}
+
+    def _load_quarantine(self):
+        try:
+            with open(self.quarantine_path, "r") as f:
+                return {json.loads(line)["key"] for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def is_quarantined(self, *texts):
+        model = self.backend.model_name
+        return any(content_key(model, text) in self.quarantined for text in texts)
+
+    def release_quarantine(self):
+        """Forget this model's quarantined texts so the next run sends them again; returns how many"""
+        if not os.path.exists(self.quarantine_path):
+            return 0
+        with open(self.quarantine_path, "r") as f:
+            entries = [line for line in f if line.strip()]
+        kept = [line for line in entries if json.loads(line)["model"] != self.backend.model_name]
+        with open(self.quarantine_path, "w") as f:
+            f.writelines(kept)
+        self.quarantined = {json.loads(line)["key"] for line in kept}
+        return len(entries) - len(kept)
+
+    def _quarantine(self, key, text, error):
+        self.quarantined.add(key)
+        self.counters["quarantined"] += 1
+        with open(self.quarantine_path, "a") as f:
+            f.write(json.dumps({"key": key, "model": self.backend.model_name, "error": str(error)[:500], "text": text[:500]}) + "\n")
+
+    def _batches(self, items):
+        batch, tokens = [], 0
+        for key, text in items:
+            cost = estimate_tokens(text)
+            if batch and (len(batch) >= self.batch_size or tokens + cost > self.batch_tokens):
+                yield batch
+                batch, tokens = [], 0
+            batch.append((key, text))
+            tokens += cost
+        if batch:
+            yield batch
+
+    async def _embed_batch(self, batch):
+        texts = [text for _, text in batch]
+        tokens = sum(estimate_tokens(text) for text in texts)
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(tokens)
+            self.counters["requests"] += 1
+            try:
+                vecs = await self.backend.aembed(texts)
+            except Exception as e:
+                if _is_bad_input(e):
+                    await self._split(batch, e)
+                    return
+                if not _is_retryable(e) or attempt == self.max_retries:
+                    raise FatalEmbeddingError(f"Embedding batch failed after {attempt + 1} attempts: {e}") from e
+
+                # Exponential backoff with jitter (never shorter than Retry-After); a 429 pauses
+                # every worker, not just this one
+                delay = max(_retry_after(e) or 0.0, min(MAX_BACKOFF, 2 ** attempt) * (0.5 + random.random() / 2))
+                self.counters["retries"] += 1
+                if _status(e) == 429:
+                    self.counters["rate_limited"] += 1
+                    self.limiter.pause(delay)
+                await asyncio.sleep(delay)
+                continue
+
+            self.checkpoint.set_many(zip((key for key, _ in batch), vecs))
+            return
+
+    async def _split(self, batch, error):
+        """Bisect a rejected batch until the offending items are isolated and quarantined"""
+        if len(batch) == 1:
+            key, text = batch[0]
+            self._quarantine(key, text, error)
+            return
+        self.counters["splits"] += 1
+        mid = len(batch) // 2
+        await self._embed_batch(batch[:mid])
+        await self._embed_batch(batch[mid:])
+
+    async def _worker(self, queue, progress):
+        while True:
+            batch = await queue.get()
+            try:
+                await self._embed_batch(batch)
+                progress.update(len(batch))
+            finally:
+                queue.task_done()
+
+    async def run(self, texts):
+        """(N, d) float32 vectors for texts, with NaN rows for quarantined items, plus their positions"""
+        model = self.backend.model_name
+        keys = [content_key(model, text) for text in texts]
+
+        unique = dict(zip(keys, texts))
+        done = self.checkpoint.get_many(list(unique))
+        todo = [(key, text) for (key, text), vec in zip(unique.items(), done) if vec is None and key not in self.quarantined]
+        if len(todo) < len(unique):
+            print(f"  resuming: {len(unique) - len(todo)} of {len(unique)} unique texts already embedded or quarantined")
+
+        queue = asyncio.Queue()
+        for batch in self._batches(todo):
+            queue.put_nowait(batch)
+
+        with tqdm(total=len(todo), unit="text") as progress:
+            workers = [asyncio.create_task(self._worker(queue, progress)) for _ in range(self.concurrency)]
+            join = asyncio.create_task(queue.join())
+            try:
+                # Finish when the queue drains, or surface the first worker that died
+                await asyncio.wait([join, *workers], return_when=asyncio.FIRST_COMPLETED)
+                for worker in workers:
+                    if worker.done() and worker.exception():
+                        raise worker.exception()
+            finally:
+                join.cancel()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(join, *workers, return_exceptions=True)
+
+        found = self.checkpoint.get_many(keys)
+        dim = next((len(vec) for vec in found if vec is not None), 0)
+        vectors = np.full((len(texts), dim), np.nan, dtype="float32")
+        failed = []
+        for i, vec in enumerate(found):
+            if vec is None:
+                failed.append(i)
+            else:
+                vectors[i] = vec
+        return vectors, failed
+
+    def embed(self, texts):
+        return asyncio.run(self.run(texts))
+
+    def stats(self):
+        return dict(self.counters)
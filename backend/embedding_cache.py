@@ -0,0 +1,124 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# --- Config ---
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", 1024))
+MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 100_000))
+
+
+def content_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """In-process LRU in front of a size-bounded SQLite store of float32 embeddings"""
+
+    def __init__(self, path=CACHE_PATH, memory_size=MEMORY_SIZE, max_entries=MAX_ENTRIES):
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.db.commit()
+
+    def _remember(self, key, vec):
+        self.memory[key] = vec
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            vec = self.memory.get(key)
+            if vec is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return vec
+
+            row = self.db.execute("SELECT vector FROM embeddings WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.db.execute("UPDATE embeddings SET last_used=? WHERE key=?", (time.time(), key))
+            self.db.commit()
+            vec = np.frombuffer(row[0], dtype="float32")
+            self._remember(key, vec)
+            self.disk_hits += 1
+            return vec
+
+    def set(self, key, vec):
+        vec = np.asarray(vec, dtype="float32")
+        with self.lock:
+            self._remember(key, vec)
+            self.db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                (key, vec.tobytes(), time.time()),
+            )
+            self._evict()
+            self.db.commit()
+
+    def get_many(self, keys):
+        """Vectors for many keys (None where missing) in chunked SELECTs, without touching the LRU"""
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk)
+                found.update((key, np.frombuffer(blob, dtype="float32")) for key, blob in rows)
+        return [found.get(key) for key in keys]
+
+    def set_many(self, items):
+        """Store (key, vector) pairs in one transaction"""
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vec, dtype="float32").tobytes(), now) for key, vec in items],
+            )
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        if self.max_entries is None:
+            return
+        count = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.db.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+
+    def stats(self):
+        with self.lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_size": len(self.memory),
+                "disk_size": self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0],
+                "max_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": hits / total if total else 0.0,
+            }
@@ -0,0 +1,147 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Config ---
+BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+LOCAL_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "all-MiniLM-L6-v2")
+LOCAL_RUNTIME = os.getenv("LOCAL_EMBEDDING_RUNTIME", "torch")  # torch | onnx
+LOCAL_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 2))
+
+executor = ThreadPoolExecutor(max_workers=EMBEDDING_THREADS, thread_name_prefix="embed")
+
+
+class EmbeddingBackend:
+    """Turns a list of texts into an (N, dim) float32 matrix"""
+
+    name = None
+    model_name = None
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+    async def aembed(self, texts):
+        return await asyncio.get_running_loop().run_in_executor(executor, self.embed, texts)
+
+
+class OpenAIBackend(EmbeddingBackend):
+    name = "openai"
+
+    def __init__(self, model="text-embedding-3-small", batch_size=100, max_retries=2):
+        self.sync_client = None
+        self.async_client = None
+        self.max_retries = max_retries
+        self.model_name = model
+        self.batch_size = batch_size
+
+    @property
+    def client(self):
+        # Created on first use: importing the API without OPENAI_API_KEY must not fail when
+        # only catalog recommendations (stored vectors) are served
+        if self.sync_client is None:
+            from openai import OpenAI
+
+            self.sync_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=self.max_retries)
+        return self.sync_client
+
+    def embed(self, texts):
+        embeddings = []
+        for i in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(model=self.model_name, input=texts[i : i + self.batch_size])
+            embeddings.extend(d.embedding for d in response.data)
+        return np.array(embeddings, dtype="float32")
+
+    async def aembed(self, texts):
+        # Native async client, so concurrent batches don't each hold an executor thread
+        if self.async_client is None:
+            from openai import AsyncOpenAI
+
+            self.async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=self.max_retries)
+        embeddings = []
+        for i in range(0, len(texts), self.batch_size):
+            response = await self.async_client.embeddings.create(model=self.model_name, input=texts[i : i + self.batch_size])
+            embeddings.extend(d.embedding for d in response.data)
+        return np.array(embeddings, dtype="float32")
+
+
+class LocalBackend(EmbeddingBackend):
+    """CPU embeddings from the bundled all-MiniLM-L6-v2 model, no network needed"""
+
+    name = "local"
+
+    def __init__(self, path=LOCAL_MODEL_PATH, runtime=LOCAL_RUNTIME, batch_size=LOCAL_BATCH_SIZE):
+        from sentence_transformers import SentenceTransformer
+
+        kwargs = {"backend": "onnx"} if runtime == "onnx" else {}
+        self.model = SentenceTransformer(path, device="cpu", **kwargs)
+        self.model_name = f"all-MiniLM-L6-v2/{runtime}"
+        self.batch_size = batch_size
+        # Separate from the module executor so embed() can fan out from inside aembed()
+        self.encode_executor = ThreadPoolExecutor(max_workers=EMBEDDING_THREADS, thread_name_prefix="encode")
+
+    def _encode(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+    def embed(self, texts):
+        # Large inputs are split across the thread pool; small ones stay on the calling thread
+        chunk = self.batch_size * 4
+        if len(texts) <= chunk:
+            return self._encode(texts).astype("float32")
+
+        chunks = [texts[i : i + chunk] for i in range(0, len(texts), chunk)]
+        return np.concatenate(list(self.encode_executor.map(self._encode, chunks))).astype("float32")
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "local": LocalBackend,
+}
+
+
+def get_backend(name=BACKEND, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**options)
+
+
+def index_paths(name=BACKEND):
+    """FAISS index and vector sidecar paths for a backend; each backend gets its own index"""
+    if name == "openai":
+        return "movie_index.faiss", "movie_vectors.npy"
+    return f"movie_index.{name}.faiss", f"movie_vectors.{name}.npy"
+
+
+def catalog_paths(name=BACKEND):
+    """Catalog directory and title/id lookup paths for a backend; both are row-aligned with its index"""
+    if name == "openai":
+        return "movie_catalog", "movie_lookup.json"
+    return f"movie_catalog.{name}", f"movie_lookup.{name}.json"
+
+
+def build_path(name=BACKEND):
+    """Symlink to a backend's live build directory (see manifest.publish_build)"""
+    if name == "openai":
+        return "movie_build"
+    return f"movie_build.{name}"
+
+
+def build_files(directory):
+    """Index, vectors, catalog and lookup paths inside a build directory. The manifest and
+    neighbour table sit next to the index (manifest.manifest_path, neighbors.neighbor_paths)."""
+    return tuple(os.path.join(directory, name) for name in ("index.faiss", "vectors.npy", "catalog", "lookup.json"))
+
+
+def live_paths(name=BACKEND):
+    """Index, vectors, catalog and lookup paths of a backend's live build.
+
+    The build symlink is resolved once, so all of them come from the same build. Trees built
+    before build directories fall back to the fixed index_paths/catalog_paths files.
+    """
+    if os.path.isdir(build_path(name)):
+        return build_files(os.path.realpath(build_path(name)))
+    return (*index_paths(name), *catalog_paths(name))
@@ -0,0 +1,101 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import bcrypt
+
+# --- Config ---
+IO_THREADS = int(os.getenv("IO_THREADS", 16))
+FAISS_THREADS = int(os.getenv("FAISS_THREADS", 2))
+BCRYPT_PROCESSES = int(os.getenv("BCRYPT_PROCESSES", 2))
+
+
+class Pool:
+    """Lazily created executor with counters for /metrics"""
+
+    def __init__(self, name, factory, size):
+        self.name = name
+        self.size = size
+        self.factory = factory
+        self.executor = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    async def run(self, fn, *args):
+        if self.executor is None:
+            self.executor = self.factory(self.size)
+
+        self.submitted += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.completed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "in_flight": self.submitted - self.completed,
+            "submitted": self.submitted,
+            "failed": self.failed,
+            "avg_ms": self.total_seconds * 1000 / self.completed if self.completed else 0.0,
+            "max_ms": self.max_seconds * 1000,
+        }
+
+
+# Blocking network/file I/O (S3, OpenAI), FAISS searches, and CPU-bound bcrypt each get their
+# own pool so a burst of one kind of work can't starve the others
+io = Pool("io", lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix="io"), IO_THREADS)
+faiss = Pool("faiss", lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix="faiss"), FAISS_THREADS)
+
+# bcrypt workers fork from a small forkserver that only preloads this module, rather than from
+# the threaded app process or by re-importing the app (and its FAISS index) per worker
+_mp_context = multiprocessing.get_context("forkserver")
+_mp_context.set_forkserver_preload([__name__])
+hashing = Pool(
+    "bcrypt",
+    lambda n: ProcessPoolExecutor(max_workers=n, mp_context=_mp_context),
+    BCRYPT_PROCESSES,
+)
+
+POOLS = [io, faiss, hashing]
+
+
+def _hashpw(password):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+def _checkpw(password, stored_hash):
+    return bcrypt.checkpw(password.encode("utf-8"), stored_hash.encode("utf-8"))
+
+
+async def hash_password(password):
+    return await hashing.run(_hashpw, password)
+
+
+async def check_password(password, stored_hash):
+    return await hashing.run(_checkpw, password, stored_hash)
+
+
+def shutdown():
+    for pool in POOLS:
+        pool.shutdown()
+
+
+def stats():
+    return {pool.name: pool.stats() for pool in POOLS}
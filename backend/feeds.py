@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from fastapi import Response
+import tmdb
+
+# --- Config ---
+FEED_SNAPSHOT_PATH = os.getenv("FEED_SNAPSHOT_PATH", "feed_snapshot.json")
+FEED_REFRESH_INTERVAL = int(os.getenv("FEED_REFRESH_INTERVAL", 60 * 60))
+# A read older than this serves the snapshot and revalidates it in the background
+FEED_MAX_AGE = int(os.getenv("FEED_MAX_AGE", 15 * 60))
+FEED_CONCURRENCY = int(os.getenv("FEED_CONCURRENCY", 8))
+TOP_RATED_PAGES = int(os.getenv("FEED_TOP_RATED_PAGES", 5))
+GENRE_PAGES = int(os.getenv("FEED_GENRE_PAGES", 4))
+
+# Browser / CDN caching of feed responses
+CLIENT_MAX_AGE = int(os.getenv("FEED_CLIENT_MAX_AGE", 5 * 60))
+CLIENT_STALE = int(os.getenv("FEED_CLIENT_STALE", 60 * 60))
+
+
+def trending_request():
+    return "movie/popular", {"language": "en-US", "page": 1}
+
+
+def top_rated_request(page=1):
+    return "movie/top_rated", {"language": "en-US", "page": page}
+
+
+def now_playing_request():
+    return "movie/now_playing", {}
+
+
+def genre_request(genre_id, page=1):
+    return "discover/movie", {"with_genres": genre_id, "sort_by": "popularity.desc", "page": page}
+
+
+# Snapshot key (the TMDB URL) -> {"data": decoded response, "fetched_at": unix time}
+snapshots = {}
+# Keys of the pages refresh_all materializes; nothing else is stored in the snapshot
+materialized = set()
+_revalidating = {}
+counters = {"served": 0, "stale_served": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+_refresher = None
+last_refresh = None
+
+
+def snapshot_key(path, params):
+    return tmdb.cache_key(path, {k: v for k, v in params.items() if v is not None})
+
+
+def load():
+    """Seed the snapshot from disk so a restart serves feeds before the first refresh finishes"""
+    try:
+        with open(FEED_SNAPSHOT_PATH, "r") as f:
+            snapshots.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.error(f"Error loading feed snapshot: {e}")
+
+
+def save():
+    tmp_path = f"{FEED_SNAPSHOT_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshots, f)
+    os.replace(tmp_path, FEED_SNAPSHOT_PATH)
+
+
+async def refresh(path, params):
+    data = await tmdb.get(path, params, fresh=True)
+    if data is not None:
+        snapshots[snapshot_key(path, params)] = {"data": data, "fetched_at": time.time()}
+    return data
+
+
+def _revalidate(path, params):
+    key = snapshot_key(path, params)
+    if key not in _revalidating:
+        task = asyncio.create_task(refresh(path, params))
+        _revalidating[key] = task
+        task.add_done_callback(lambda t: _revalidating.pop(key, None))
+
+
+async def get(path, params):
+    """Decoded TMDB feed response from the snapshot; live fetch only when it isn't materialized"""
+    key = snapshot_key(path, params)
+    snapshot = snapshots.get(key)
+    if snapshot is None:
+        counters["misses"] += 1
+        if key in materialized:
+            return await refresh(path, params)
+        # Any other genre/page a client asks for only goes through the TTL cache, so
+        # user input can't grow the snapshot
+        return await tmdb.get(path, params)
+
+    counters["served"] += 1
+    if time.time() - snapshot["fetched_at"] > FEED_MAX_AGE:
+        counters["stale_served"] += 1
+        _revalidate(path, params)
+    return snapshot["data"]
+
+
+async def feed_requests():
+    requests = [trending_request(), now_playing_request()]
+    requests += [top_rated_request(page) for page in range(1, TOP_RATED_PAGES + 1)]
+
+    genres = await tmdb.get("genre/movie/list")
+    for genre in (genres or {}).get("genres", []):
+        requests += [genre_request(genre["id"], page) for page in range(1, GENRE_PAGES + 1)]
+    return requests
+
+
+async def refresh_all():
+    """Re-materialize every feed page, then persist the snapshot"""
+    global last_refresh
+    semaphore = asyncio.Semaphore(FEED_CONCURRENCY)
+
+    async def bounded(path, params):
+        async with semaphore:
+            try:
+                if await refresh(path, params) is None:
+                    counters["refresh_errors"] += 1
+            except Exception as e:
+                counters["refresh_errors"] += 1
+                logging.error(f"Error refreshing feed {path}: {e}")
+
+    requests = await feed_requests()
+    materialized.clear()
+    materialized.update(snapshot_key(path, params) for path, params in requests)
+
+    await asyncio.gather(*(bounded(path, params) for path, params in requests))
+    # Drop pages that are no longer part of the feed set, including any seeded from an older file
+    for key in set(snapshots) - materialized:
+        del snapshots[key]
+    counters["refreshes"] += 1
+    last_refresh = time.time()
+    await asyncio.to_thread(save)
+
+
+async def refresher():
+    while True:
+        try:
+            await refresh_all()
+        except Exception as e:
+            logging.error(f"Error refreshing feed snapshot: {e}")
+        await asyncio.sleep(FEED_REFRESH_INTERVAL)
+
+
+def start():
+    global _refresher
+    load()
+    _refresher = asyncio.create_task(refresher())
+
+
+async def stop():
+    tasks = [t for t in [_refresher, *_revalidating.values()] if t is not None]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def feed_response(request, content):
+    """JSON response with a content ETag; 304 when the client already has this version"""
+    body = json.dumps(content, separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CLIENT_MAX_AGE}, stale-while-revalidate={CLIENT_STALE}",
+    }
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def stats():
+    return {
+        **counters,
+        "snapshots": len(snapshots),
+        "materialized": len(materialized),
+        "revalidating": len(_revalidating),
+        "last_refresh_age_s": time.time() - last_refresh if last_refresh else None,
+    }
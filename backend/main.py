@@ -1,28 +1,50 @@
-from werkzeug.utils import secure_filename
 import json
+import base64
 import os
 from datetime import datetime
 from dotenv import load_dotenv
 from datetime import timedelta
-import bcrypt
 import requests 
-from db import conn, s3, BUCKET
+from db import get_conn, connection, open_pool, close_pool, pool_stats, s3, BUCKET
+import uploads
 import logging
 import model
-from fastapi import FastAPI, Query, HTTPException, Request, APIRouter, UploadFile, File, Form
+from fastapi import FastAPI, Query, HTTPException, Request, APIRouter, UploadFile, File, Form, Depends
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions  import SessionMiddleware
 import uvicorn
-import httpx
 import asyncio
-from pydantic import BaseModel
+import numpy as np
+import tmdb
+import feeds
+import taste
+import executors
+from coalesce import Coalescer
+from user_stats import fetch_user_stats, movie_title
+from content_filter import default_filter
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field
 logging.basicConfig(level=logging.DEBUG)
 
 import pandas as pd
 
 ## FastAPI App Initialization
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_pool()
+    uploads.start()
+    feeds.start()
+    model.start()
+    yield
+    await model.stop()
+    await feeds.stop()
+    await uploads.stop()
+    await tmdb.close()
+    await close_pool()
+    executors.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://www.popcornpick.app"],          # <-- any domain can access
@@ -45,12 +67,17 @@ load_dotenv()
 
 # TMDB API key
 API_KEY = os.getenv("API_KEY")
-API_TOKEN = os.getenv("API_TOKEN")
 
 @app.get("/")
 def health():
     return "Backend is alive!"
 
+@app.get("/metrics")
+def metrics():
+    return {"tmdb": tmdb.stats(), "db_pool": pool_stats(), "embeddings": model.embedding_cache.stats(),
+            "embedding_batches": query_embedder.stats(), "executors": executors.stats(),
+            "uploads": uploads.stats(), "feeds": feeds.stats(), "taste": taste.cache.stats()}
+
 ## Endpoint for Session Check
 @app.get('/check_session')
 async def check_session(request: Request):
@@ -59,34 +86,45 @@ async def check_session(request: Request):
         return {"loggedIn": True, "user": user}
     return {"loggedIn": False}
 
+# Concurrent /recommend calls share one batched embeddings request
+query_embedder = Coalescer(model.embed_queries, window=float(os.getenv("EMBED_COALESCE_WINDOW", 0.005)), runner=executors.io.run)
+
 ## API Endpoint for search_bar.tsx
 @app.get('/recommend')
 async def recommend(title: str = Query(..., description="Movie title to get recommendations for")):
-    formatted = title.title().replace(" ", "+")
-    headers = {
-        'Authorization': f"Bearer {API_TOKEN}"
-    }
-    
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        # 1️⃣ Get movie ID from TMDB
-        search_url = f"https://api.themoviedb.org/3/search/movie?query={formatted}"
-        search_resp = await client.get(search_url, headers=headers)
+    # 1️⃣ Get movie ID from the local catalog, falling back to TMDB search
+    movie_id = await resolve_movie_id(title)
+
+    if movie_id is None:
+        raise HTTPException(status_code=500, detail="Could not retrieve movie information")
+
+    # Catalog movies are searched from their stored vectors, no embedding calls. One build
+    # for the whole request, so an index hot-swap can't land between the lookup and the search.
+    build = model.current
+    if model.lookup_row(movie_id, build) is not None:
+        hits = await executors.faiss.run(lambda: model.recommend_by_id(movie_id, build=build))
+        return JSONResponse(content={"recommendations": hits["titles"], "scores": hits["scores"]})
+
+    # 2️⃣ Fetch detailed info + credits, 3️⃣ extract it, 4️⃣ embed (batched with concurrent requests)
+    query_vec = await query_vector(movie_id)
 
-        if search_resp.status_code != 200 or not search_resp.json().get("results"):
-            raise HTTPException(status_code=500, detail="Could not retrieve movie information")
+    if query_vec is None:
+        raise HTTPException(status_code=500, detail="Could not retrieve movie details")
 
-        movie_id = search_resp.json()["results"][0]["id"]
+    # Search without blocking the event loop
+    hits = (await executors.faiss.run(model.search_batch, query_vec[None, :]))[0]
 
-        # 2️⃣ Fetch detailed info + credits concurrently
-        id_url = f"https://api.themoviedb.org/3/movie/{movie_id}?append_to_response=credits"
-        id_resp = await client.get(id_url, headers=headers)
+    # 5️⃣ Return JSON response
+    return JSONResponse(content={"recommendations": hits["titles"], "scores": hits["scores"]})
+    
 
-        if id_resp.status_code != 200:
-            raise HTTPException(status_code=500, detail="Could not retrieve movie details")
+async def query_vector(movie_id):
+    """Query vector for an off-catalog movie from its TMDB details, or None if TMDB has none"""
+    data = await tmdb.get(f"movie/{movie_id}", {"append_to_response": "credits"})
 
-        data = id_resp.json()
+    if data is None:
+        return None
 
-    # 3️⃣ Extract relevant movie data
     movie_data = {
         "overview": data.get("overview"),
         "genres": [g.get("name") for g in data.get("genres", [])],
@@ -96,84 +134,126 @@ async def recommend(title: str = Query(..., description="Movie title to get reco
             None,
         ),
     }
+    return await query_embedder.submit(movie_data)
 
-    # 4️⃣ Run your model.vectorize() without blocking event loop
-    recommendations = await asyncio.to_thread(model.vectorize, movie_data)
+## Recommendations for many movies at once (e.g. all of a user's favourites)
+RECOMMEND_BATCH_MAX = int(os.getenv("RECOMMEND_BATCH_MAX", 50))
 
-    # 5️⃣ Return JSON response
-    return JSONResponse(content={"recommendations": recommendations})
-    
+class RecommendBatchBody(BaseModel):
+    titles: list[str] = Field(default_factory=list, max_length=RECOMMEND_BATCH_MAX)
+    ids: list[str] = Field(default_factory=list, max_length=RECOMMEND_BATCH_MAX)
+    top_k: int = Field(20, ge=1, le=100)
+
+@app.post('/recommend_batch')
+async def recommend_batch(body: RecommendBatchBody):
+    queries = body.titles + body.ids
+    if not queries:
+        raise HTTPException(status_code=400, detail="No titles or ids given")
+
+    # Titles resolve from the catalog first; off-catalog movies are fetched and embedded
+    # concurrently, so the coalescer turns them into one embeddings request
+    movie_ids = await asyncio.gather(*(resolve_movie_id(title) for title in body.titles))
+    movie_ids = [None if m is None else str(m) for m in movie_ids] + body.ids
+    build = model.current
+    off_catalog = list({m for m in movie_ids if m is not None and model.lookup_row(m, build) is None})
+    vecs = await asyncio.gather(*(query_vector(m) for m in off_catalog), return_exceptions=True)
+    query_vecs = {m: vec for m, vec in zip(off_catalog, vecs) if isinstance(vec, np.ndarray)}
+
+    # One index.search over the whole (N, d) query matrix
+    results = await executors.faiss.run(
+        lambda: model.recommend_by_ids(movie_ids, body.top_k, query_vecs=query_vecs, build=build)
+    )
+    merged = model.fuse([hits for hits in results if hits is not None], top_k=body.top_k)
+
+    per_query = []
+    for query, movie_id, hits in zip(queries, movie_ids, results):
+        if hits is None:
+            per_query.append({"query": query, "error": "not found"})
+        else:
+            per_query.append({"query": query, "movie_id": movie_id, "recommendations": hits["titles"],
+                              "ids": hits["ids"], "scores": hits["scores"]})
+
+    return {"recommendations": merged["titles"], "ids": merged["ids"], "scores": merged["scores"],
+            "per_query": per_query}
 
 ## API Endpoint for api.tsx & movie.tsx
 @app.get('/search_recommended')
-async def search_api(movies: list[str] = Query(..., description="List of movie titles")):
-    result = await details(movies)
+async def search_api(movies: list[str] = Query(..., description="List of movie titles"),
+                     deadline: float | None = Query(None, description="Seconds allowed per title lookup")):
+    result = await details(movies, deadline=deadline)
     return {"details": result}
 
-async def details(movies):
-    movie_details = []
-    headers = {
-        'Authorization': f"Bearer {API_TOKEN}"
-    }
+DETAILS_CONCURRENCY = int(os.getenv("DETAILS_CONCURRENCY", 10))
+DETAILS_DEADLINE = float(os.getenv("DETAILS_DEADLINE", 3.0))
+
+async def resolve_movie_id(title):
+    """TMDB id for a title, skipping the search round-trip for catalog titles"""
+    movie_id = model.lookup_id(title)
+    if movie_id is not None:
+        return movie_id
+    
+    tmdb_data = await tmdb.get("search/movie", {"query": title.title()})
+    
+    if not tmdb_data or not tmdb_data.get("results"):
+        return None
     
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        for title in movies:
-            formatted = title.title().replace(" ", "+")
-            url = f'https://api.themoviedb.org/3/search/movie?query={formatted}'
-            response = await client.get(url, headers=headers)
+    return tmdb_data['results'][0]['id']
 
-            
-            if response.status_code != 200 or not response.json().get("results"):
-                raise HTTPException(status_code=500, detail="Could not retrieve movie information")
-            
-            tmdb_data = response.json()
-            movie_id = tmdb_data['results'][0]['id']
-            
-            id_url = f'https://api.themoviedb.org/3/movie/{movie_id}?append_to_response=credits'
-            id_resp = await client.get(id_url, headers=headers)
-            
-            
-            if id_resp.status_code != 200:
-                raise HTTPException(status_code=500, detail="Could not retrieve movie information")
-            
-            data = id_resp.json()
-            
-            if data.get('poster_path'):
-                posters = {
-                    "id": data.get("id"),
-                    "title": data.get("title"),
-                    "poster_path": data.get("poster_path"),
-                    "backdrop_path": data.get("backdrop_path"),
-                    "overview": data.get("overview"),
-                    "release_date": data.get("release_date"),
-                    "genres": [g.get("name") for g in data.get("genres", [])],
-                    "director": next(
-                        (
-                            crew.get("name")
-                            for crew in data.get("credits", {}).get("crew", [])
-                            if crew.get("job") == "Director"
-                        ),
-                        None,
-                    ),
-                }
-                movie_details.append(posters)
-        return movie_details  
+async def movie_detail(title):
+    movie_id = await resolve_movie_id(title)
+    
+    if movie_id is None:
+        return None
+    
+    data = await tmdb.get(f"movie/{movie_id}", {"append_to_response": "credits"})
+    
+    if data is None or not data.get('poster_path'):
+        return None
+    
+    return {
+        "id": data.get("id"),
+        "title": data.get("title"),
+        "poster_path": data.get("poster_path"),
+        "backdrop_path": data.get("backdrop_path"),
+        "overview": data.get("overview"),
+        "release_date": data.get("release_date"),
+        "genres": [g.get("name") for g in data.get("genres", [])],
+        "director": next(
+            (
+                crew.get("name")
+                for crew in data.get("credits", {}).get("crew", [])
+                if crew.get("job") == "Director"
+            ),
+            None,
+        ),
+    }
+
+async def details(movies, deadline=None):
+    """Look up every title concurrently, keeping input order and dropping failed or slow titles"""
+    deadline = deadline or DETAILS_DEADLINE
+    semaphore = asyncio.Semaphore(DETAILS_CONCURRENCY)
+    
+    async def bounded(title):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(movie_detail(title), timeout=deadline)
+            except asyncio.TimeoutError:
+                logging.warning(f"Detail lookup timed out for {title!r}")
+            except Exception as e:
+                logging.error(f"Detail lookup failed for {title!r}: {e}")
+            return None
+    
+    results = await asyncio.gather(*(bounded(title) for title in movies))
+    return [movie for movie in results if movie is not None]
 
 @app.get("/search_fav_movie")  
 async def fav_movie(movie: str = Query(..., description="Favorite movie title")):
     movie_list = []
-    formatted = movie.title().replace(" ", "+")
-    headers = {
-        'Authorization': f"Bearer {API_TOKEN}"
-    }
-    url = f'https://api.themoviedb.org/3/search/movie?query={formatted}'
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
+    data = await tmdb.get("search/movie", {"query": movie.title()})
     
-    if response.status_code != 200 or not response.json().get("results"):
+    if not data or not data.get("results"):
         raise HTTPException(status_code=500, detail="Could not retrieve movie information")
     
-    data = response.json()
     results = data.get('results')
     
     if not results:
@@ -191,19 +271,11 @@ async def fav_movie(movie: str = Query(..., description="Favorite movie title"))
     return {"movie": movie_list}
     
 async def id_to_title(id):
-    headers = {
-        'Authorization': f"Bearer {API_TOKEN}"
-    }
-    
-    url = f'https://api.themoviedb.org/3/movie/{id}'
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
+    data = await tmdb.get(f"movie/{id}")
         
-    if response.status_code != 200:
+    if data is None:
         raise HTTPException(status_code=500, detail="Could not retrieve movie information")
         
-    data = response.json()
     return data.get("title", "Unknown Title")
 
 
@@ -215,20 +287,13 @@ async def get_title(id: str = Query(..., description="Movie ID")):
 ## Watchlist Table Endpoints
 
 @app.get("/get_latest_releases")
-async def get_latest_releases():
-    headers = {
-        'Authorization': f"Bearer {API_TOKEN}"
-    }
-    url = 'https://api.themoviedb.org/3/movie/now_playing'
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
+async def get_latest_releases(request: Request):
+    data = await feeds.get(*feeds.now_playing_request())
     
-    if response.status_code != 200:
+    if data is None:
         raise HTTPException(status_code=500, detail="Could not retrieve movie information")
     
     movie_details = []
-    data = response.json()
     movies = data.get("results")
     
     for movie in movies:
@@ -238,20 +303,15 @@ async def get_latest_releases():
         movie_info["backdrop_path"] = movie.get("backdrop_path")
         
         movie_details.append(movie_info)    
-    return {"latest": movie_details}
+    return feeds.feed_response(request, {"latest": movie_details})
 
 @app.get("/load_genres")
 async def load_genres(request: Request):
     username = request.session.get("user")
-    url = f"https://api.themoviedb.org/3/genre/movie/list?api_key={API_KEY}"
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
+    genres = await tmdb.get("genre/movie/list", {"api_key": API_KEY})
     
-    if response.status_code != 200:
+    if genres is None:
         raise HTTPException(status_code=500, detail="Could not retrieve genre information")
-        
-    genres = response.json()
     
     genre_ids = {}
     for genre in genres.get("genres", []):
@@ -259,62 +319,27 @@ async def load_genres(request: Request):
     return {"genres": genre_ids, "user": username}
 
 @app.get("/genre_sort")
-async def by_genre(genre: str = Query(..., description="Genre ID"), page: int = Query(1, description="Page number")):
-    genre_id = genre
-    page_num = page
-    nums = [page_num, page_num+1]
-    movies = []
-    headers = {
-        'Authorization': f"Bearer {API_TOKEN}"
-    }
-    
-    for i in nums:
-        url = f"https://api.themoviedb.org/3/discover/movie?with_genres={genre_id}&sort_by=popularity.desc&page={i}"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail="Could not retrieve movie information")
-            
-        data = response.json()
-        
-        bad_keywords = [
-        "sex", "sexual", "seduce", "seduction", "paedophilia", "pedo", "porn", "xxx", "erotic", "adult", "stepparent", "stepmom", "stepdad"
-        ]
-        
-        languages = ["en"]
-        
-        for movie in data.get("results", []):
-            title_lower = (movie.get("title") or "").lower()
-            overview_lower = (movie.get("overview") or "").lower()
-            poster = movie.get("poster_path")
-            
-            if (poster) and (not movie.get("adult")) and not any(k in title_lower or k in overview_lower for k in bad_keywords) and (movie.get("original_language") in languages):
-                movie_info = {
-                    "id": movie.get("id"),
-                    "title": movie.get("title"),
-                    "poster_path": movie.get("poster_path")
-                }
-                
-                movies.append(movie_info)
-    return {"by_genre": movies}
+async def by_genre(request: Request, genre: str = Query(..., description="Genre ID"), page: int = Query(1, description="Page number")):
+    pages = await asyncio.gather(*(feeds.get(*feeds.genre_request(genre, i)) for i in [page, page + 1]))
+
+    if any(data is None for data in pages):
+        raise HTTPException(status_code=500, detail="Could not retrieve movie information")
+
+    movies = [
+        {"id": movie.get("id"), "title": movie.get("title"), "poster_path": movie.get("poster_path")}
+        for data in pages
+        for movie in default_filter.apply(data.get("results", []))
+    ]
+    return feeds.feed_response(request, {"by_genre": movies})
 
 @app.get("/trending")
-async def trending():
-    headers = {
-        'Authorization': f"Bearer {API_TOKEN}"
-    }
-    url = "https://api.themoviedb.org/3/movie/popular?language=en-US&page=1"
+async def trending(request: Request):
+    data = await feeds.get(*feeds.trending_request())
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
-    
-    if response.status_code != 200:
+    if data is None:
         raise HTTPException(status_code=500, detail="Could not retrieve movie information")
         
     movie_details = []
-    data = response.json()
     movies = data.get("results")
     
     for movie in movies:
@@ -326,23 +351,16 @@ async def trending():
         
         movie_details.append(details_dict)
         
-    return {"trending": movie_details}
+    return feeds.feed_response(request, {"trending": movie_details})
 
 @app.get("/top_rated")
-async def top_rated():
-    headers = {
-        'Authorization': f"Bearer {API_TOKEN}"
-    }
-    url = "https://api.themoviedb.org/3/movie/top_rated?language=en-US&page=1"
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
+async def top_rated(request: Request):
+    data = await feeds.get(*feeds.top_rated_request())
     
-    if response.status_code != 200:
+    if data is None:
         raise HTTPException(status_code=500, detail="Could not retrieve movie information")
         
     movie_details = []
-    data = response.json()
     movies = data.get("results")
     
     for movie in movies:
@@ -354,23 +372,16 @@ async def top_rated():
         
         movie_details.append(details_dict)
         
-    return {"rated": movie_details}
+    return feeds.feed_response(request, {"rated": movie_details})
 
 @app.get("/more_top_rated")
-async def more_top_rated(page_num: int = Query(1, description="Page number")):
-    headers = {
-        'Authorization': f"Bearer {API_TOKEN}"
-    }
-    url = f"https://api.themoviedb.org/3/movie/top_rated?language=en-US&page={page_num}"
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
+async def more_top_rated(request: Request, page_num: int = Query(1, description="Page number")):
+    data = await feeds.get(*feeds.top_rated_request(page_num))
     
-    if response.status_code != 200:
+    if data is None:
         raise HTTPException(status_code=500, detail="Could not retrieve movie information")
         
     movie_details = []
-    data = response.json()
     movies = data.get("results")
     
     for movie in movies:
@@ -382,170 +393,181 @@ async def more_top_rated(page_num: int = Query(1, description="Page number")):
         
         movie_details.append(details_dict)
         
-    return {"rated": movie_details}
+    return feeds.feed_response(request, {"rated": movie_details})
 
 @app.get("/get_user_data")
-async def user_data(request: Request):
+async def user_data(request: Request, conn=Depends(get_conn)):
     user = request.session.get("user")
     
     try:
         cur = conn.cursor()
         
-        cur.execute(
+        await cur.execute(
             'SELECT fav_genres, fav_movies FROM users WHERE username=%s', (user,)
         )
         
-        row = cur.fetchone()
+        row = await cur.fetchone()
         genres_list = row[0]
         movies_list = row[1]
         
-        conn.commit()
-        cur.close()
+        await conn.commit()
+        await cur.close()
         
         return {"user_data": [genres_list, movies_list]}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
         
 @app.get("/get_user_stats")
 async def user_stats(request: Request):
     user_id = request.session.get("user_id")
     
-    try:
-        cur = conn.cursor()
-        
-        cur.execute(
-            'SELECT rating, movie_id FROM ratings WHERE user_id=%s', (str(user_id),)
-        )
-        
-        rows = cur.fetchall()
-        num_ratings = len(rows)
-        max_rating = 0
-        max_rated_movie_id = None
-        
-        for row in rows:
-            if row[0] > max_rating:
-                max_rating = row[0]
-                max_rated_movie_id = row[1]
-            
-        max_rated_movie = await id_to_title(max_rated_movie_id) if max_rating > 0 else ""
-        
-        conn.commit()
-        cur.close()
+    # The connection goes back to the pool before the top movie's title, which can hit TMDB
+    async with connection() as conn:
+        try:
+            stats = await fetch_user_stats(conn, user_id)
+            await conn.commit()
+        except Exception as e:
+            logging.error(f"Error during user search: {e}")
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail="Database error")
+    
+    top_movie = await movie_title(stats["top_movie_id"]) if stats["top_movie_id"] is not None else ""
+    return {
+        "user_stats": [stats["count"], [top_movie, stats["max_rating"]]],
+        "avg_rating": stats["avg_rating"],
+        "histogram": stats["histogram"],
+    }
         
-        return {"user_stats": [num_ratings, [max_rated_movie, max_rating]]}
+## Personalized recommendations from the user's ratings, watchlist and favourites
+@app.get("/for_you")
+async def for_you(request: Request, limit: int = Query(20, ge=1, le=100)):
+    user = request.session.get("user_id")
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    
+    # A cached profile needs no connection; a miss holds one only while it loads
+    try:
+        profile = await taste.get_profile(user)
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
+    
+    vec, seen_rows, build = profile.snapshot()
+    if vec is None:
+        return {"for_you": []}
+    
+    hits = await executors.faiss.run(taste.recommend, vec, seen_rows, limit, build)
+    return {"for_you": [
+        {"title": title, "movie_id": movie_id, "score": score}
+        for title, movie_id, score in zip(hits["titles"], hits["ids"], hits["scores"])
+    ]}
 
-    finally:
-        if 'cur' in locals() and not cur.closed:
-            cur.close()
-        
 @app.get("/add_to_watchlist")
 @app.post("/add_to_watchlist")
-def add_to_watchlist(request: Request, title: str = Query(...), poster_path: str = Query(...), genres: str = Query(...), id: str = Query(...)):
+async def add_to_watchlist(request: Request, title: str = Query(...), poster_path: str = Query(...), genres: str = Query(...), id: str = Query(...), conn=Depends(get_conn)):
     user = request.session.get("user_id")
     
     try:
         cur = conn.cursor()
         
-        cur.execute(
+        await cur.execute(
             'INSERT INTO watchlist (title, poster_path, genres, movie_id, user_id) VALUES (%s, %s, %s, %s, %s)',
             (title, poster_path, genres, id, user)
         )
         
-        conn.commit()
-        cur.close()
+        await conn.commit()
+        await cur.close()
+        taste.record_watchlist(user, id)
         
         return {"message": "added"}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
 
 @app.get("/remove_from_watchlist")
 @app.post("/remove_from_watchlist")
-async def remove_from_watchlist(request: Request, title: str = Query(...), poster_path: str = Query(...), genres: str = Query(...)):
+async def remove_from_watchlist(request: Request, title: str = Query(...), poster_path: str = Query(...), genres: str = Query(...), conn=Depends(get_conn)):
     user = request.session.get("user_id")
     
     try:
         cur = conn.cursor()
         
-        cur.execute(
+        await cur.execute(
             'DELETE FROM watchlist WHERE title=%s AND poster_path=%s AND genres=%s AND user_id=%s',
             (title, poster_path, genres, user)
         )
         
-        conn.commit()
-        cur.close()
+        await conn.commit()
+        await cur.close()
+        taste.invalidate(user)
         
         return {"message": "removed"}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
 
 
 @app.get("/check_watchlist")
-async def check_watchlist(request: Request, poster_path: str = Query(...)):
+async def check_watchlist(request: Request, poster_path: str = Query(...), conn=Depends(get_conn)):
     user = request.session.get("user_id")
     
     try:
         cur = conn.cursor()
         
-        cur.execute(
+        await cur.execute(
         "SELECT EXISTS(SELECT 1 FROM watchlist WHERE poster_path=%s AND user_id=%s)",
         (poster_path, user)
         )
         
-        conn.commit()
+        await conn.commit()
         
-        result = cur.fetchone()[0]
-        cur.close()
+        result = (await cur.fetchone())[0]
+        await cur.close()
         
         return {"exists": result}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
 
 @app.get("/get_watchlist")
-async def fetch_movies(request: Request):
+async def fetch_movies(request: Request, conn=Depends(get_conn)):
     user = request.session.get("user_id")
     
     try:
         cur = conn.cursor()
         
-        cur.execute("SELECT * FROM watchlist WHERE user_id=%s", (user,))
+        await cur.execute("SELECT * FROM watchlist WHERE user_id=%s", (user,))
         
-        rows = cur.fetchall()
-        cur.close()
+        rows = await cur.fetchall()
+        await cur.close()
         
         watchlist = [{"title": row[1], "poster_path": row[2], "genres": row[3], "id": row[4]} for row in rows]
         
         return {"watchlist": watchlist}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
             
 class SearchUserBody(BaseModel):
     username: str
@@ -557,41 +579,42 @@ async def search_user(body: SearchUserBody, request: Request):
     username = body.username
     password = body.password
     
-    try: 
-        cur = conn.cursor()
-        
-        cur.execute(
-        "SELECT id, password FROM users WHERE username=%s",
-        (username,)
-        )
-        
-        conn.commit()
-        
-        row = cur.fetchone()
-        cur.close()
-        
-        if row is None:
-            return {"exists": False}
-        
-        user = row[0]
-        stored_hash = row[1].encode('utf-8')  
-        password_bytes = password.encode('utf-8')
-        
-        if bcrypt.checkpw(password_bytes, stored_hash):
-            request.session["user_id"] = user
-            request.session["user"] = username
-            response = {"exists": True, "user": username}
+    # The connection goes back to the pool before the bcrypt check
+    async with connection() as conn:
+        try: 
+            cur = conn.cursor()
             
-            return response
-        else:
-            return {"exists": False}
-    except Exception as e:
-        logging.error(f"Error during user search: {e}")
-        conn.rollback()
-        raise HTTPException(status_code=500, detail="Database error")
-    finally:
-        if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.execute(
+            "SELECT id, password FROM users WHERE username=%s",
+            (username,)
+            )
+            
+            await conn.commit()
+            
+            row = await cur.fetchone()
+            await cur.close()
+        except Exception as e:
+            logging.error(f"Error during user search: {e}")
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail="Database error")
+        finally:
+            if 'cur' in locals() and not cur.closed:
+                await cur.close()
+    
+    if row is None:
+        return {"exists": False}
+    
+    user = row[0]
+    stored_hash = row[1]
+    
+    if await executors.check_password(password, stored_hash):
+        request.session["user_id"] = user
+        request.session["user"] = username
+        response = {"exists": True, "user": username}
+        
+        return response
+    else:
+        return {"exists": False}
             
 @app.get("/logout")
 @app.post("/logout")
@@ -611,88 +634,93 @@ async def add_user_complete(file: UploadFile | None = File(None),
     username: str | None = Form(None),
     password: str | None = Form(None),
     genres: str = Form(...),
-    movies: str = Form(...)
+    movies: str = Form(...),
 ):
     
     genres_dict = json.loads(genres) if genres else []
     movies_list = json.loads(movies) if movies else []
     
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()) if password else None
+    hashed = await executors.hash_password(password) if password else None
     
     profile_pic_url = None
+    s3_key = None
     
     if file:
-        filename = secure_filename(file.filename)
-        s3_key = f"profile_pics/{username}/{filename}"
-        s3.upload_fileobj(file.file, BUCKET, s3_key)
-        profile_pic_url = f"https://{BUCKET}.s3.amazonaws.com/{s3_key}"
+        if file.size and file.size > uploads.MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Profile picture is too large")
+        s3_key = await uploads.upload_stream(file.file, username, file.filename, file.content_type)
+        profile_pic_url = uploads.object_url(s3_key)
     
-    try:
-        cur = conn.cursor()
+    async with connection() as conn:
+        try:
+            cur = conn.cursor()
         
-        if hashed:
-            cur.execute(
-            'INSERT INTO users (password, username, fav_genres, fav_movies, profile_pic) VALUES (%s, %s, %s, %s, %s)',
-                (hashed.decode('utf-8'), username, json.dumps(genres_dict), json.dumps(movies_list), profile_pic_url)
-            )
-        else:
-            if file and profile_pic_url:
-                cur.execute(
-                'UPDATE users SET fav_genres= %s, fav_movies= %s, profile_pic= %s WHERE username= %s',
-                    (json.dumps(genres_dict), json.dumps(movies_list), profile_pic_url, username)
+            if hashed:
+                await cur.execute(
+                'INSERT INTO users (password, username, fav_genres, fav_movies, profile_pic) VALUES (%s, %s, %s, %s, %s)',
+                    (hashed, username, json.dumps(genres_dict), json.dumps(movies_list), profile_pic_url)
                 )
             else:
-                cur.execute(
-                'UPDATE users SET fav_genres= %s, fav_movies= %s WHERE username= %s',
-                    (json.dumps(genres_dict), json.dumps(movies_list), username)
-                )
+                if file and profile_pic_url:
+                    await cur.execute(
+                    'UPDATE users SET fav_genres= %s, fav_movies= %s, profile_pic= %s, profile_pic_variants= NULL WHERE username= %s',
+                        (json.dumps(genres_dict), json.dumps(movies_list), profile_pic_url, username)
+                    )
+                else:
+                    await cur.execute(
+                    'UPDATE users SET fav_genres= %s, fav_movies= %s WHERE username= %s',
+                        (json.dumps(genres_dict), json.dumps(movies_list), username)
+                    )
             
-        conn.commit()
-        cur.close()
+            await conn.commit()
+            await cur.close()
+        
+            if s3_key:
+                uploads.enqueue_variants(username, s3_key)
 
-        return JSONResponse({"message": "done"}, status_code=200)
+            return JSONResponse({"message": "done"}, status_code=200)
     
-    except Exception as e:
-        logging.error(f"Error during user search: {e}")
-        conn.rollback()
-        raise HTTPException(status_code=500, detail="Database error")
-    finally:
-        if 'cur' in locals() and not cur.closed:
-            cur.close()
+        except Exception as e:
+            logging.error(f"Error during user search: {e}")
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail="Database error")
+        finally:
+            if 'cur' in locals() and not cur.closed:
+                await cur.close()
 
 class UserCheckBody(BaseModel):
     username: str
             
 @app.post("/check_user")
 @app.get("/check_user")
-async def check_user(body: UserCheckBody):
+async def check_user(body: UserCheckBody, conn=Depends(get_conn)):
     username = body.username
     try:
         cur = conn.cursor()
         
-        cur.execute(
+        await cur.execute(
             'SELECT * FROM users WHERE username = %s',
             (username, ) # hashed.decode('utf-8'), username
         )
         
-        row = cur.fetchone()
+        row = await cur.fetchone()
         
         if row:
             message = "User already exists"
         else:
             message = "New user"
 
-        conn.commit()
-        cur.close()
+        await conn.commit()
+        await cur.close()
         
         return {"message": message}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
             
 class AddUserBody(BaseModel):
     setup: bool | str   
@@ -711,244 +739,452 @@ async def add_user(body: AddUserBody):
     movies = body.movies
     
     if setup != "exists":
-        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed = await executors.hash_password(password)
     
-    try:
-        if setup == "exists":
-            genres_dict = json.loads(genres) if genres else {}
-            movies_list = json.loads(movies) if movies else []
+    async with connection() as conn:
+        try:
+            if setup == "exists":
+                genres_dict = json.loads(genres) if genres else {}
+                movies_list = json.loads(movies) if movies else []
             
-            cur = conn.cursor()
+                cur = conn.cursor()
             
-            cur.execute(
-            'UPDATE users SET fav_genres=%s, fav_movies=%s WHERE username=%s',
-                (json.dumps(genres_dict), json.dumps(movies_list), username)
-            )
+                await cur.execute(
+                'UPDATE users SET fav_genres=%s, fav_movies=%s WHERE username=%s',
+                    (json.dumps(genres_dict), json.dumps(movies_list), username)
+                )
             
-            message = "updated"
+                message = "updated"
 
-            conn.commit()
-            cur.close()
+                await conn.commit()
+                await cur.close()
 
-            return {"message": message}
-        else:
-            genres_dict = json.loads(genres) if genres else {}
-            movies_list = json.loads(movies) if movies else []
+                return {"message": message}
+            else:
+                genres_dict = json.loads(genres) if genres else {}
+                movies_list = json.loads(movies) if movies else []
             
-            cur = conn.cursor()
+                cur = conn.cursor()
             
-            cur.execute(
-            'INSERT INTO users (password, username, fav_genres, fav_movies, profile_pic) VALUES (%s, %s, %s, %s, %s)',
-                (hashed.decode('utf-8'), username, json.dumps(genres_dict), json.dumps(movies_list), "")
-            )
+                await cur.execute(
+                'INSERT INTO users (password, username, fav_genres, fav_movies, profile_pic) VALUES (%s, %s, %s, %s, %s)',
+                    (hashed, username, json.dumps(genres_dict), json.dumps(movies_list), "")
+                )
             
-            message = "added"
+                message = "added"
 
-            conn.commit()
-            cur.close()
+                await conn.commit()
+                await cur.close()
 
-            return {"message": message}
+                return {"message": message}
             
-    except Exception as e:
-        logging.error(f"Error during user search: {e}")
-        conn.rollback()
-        raise HTTPException(status_code=500, detail="Database error")
-    finally:
-        if 'cur' in locals() and not cur.closed:
-            cur.close()
+        except Exception as e:
+            logging.error(f"Error during user search: {e}")
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail="Database error")
+        finally:
+            if 'cur' in locals() and not cur.closed:
+                await cur.close()
             
 @app.delete("/delete_user")
-async def delete_user(request: Request):
+async def delete_user(request: Request, conn=Depends(get_conn)):
     user = request.session.get("user")
     try: 
         cur = conn.cursor()
         
-        cur.execute(
+        await cur.execute(
         "SELECT id FROM users WHERE username=%s",
         (user,)
         )
         
-        user_id = cur.fetchone()[0]
+        user_id = (await cur.fetchone())[0]
                 
-        cur.execute("DELETE FROM watchlist WHERE user_id=%s", (user_id,))
-        cur.execute("DELETE FROM ratings WHERE user_id=%s", (str(user_id),))
-        cur.execute("DELETE FROM comments WHERE username=%s", (user,))
-        cur.execute("DELETE FROM users WHERE id=%s", (user_id,))
+        await cur.execute("DELETE FROM watchlist WHERE user_id=%s", (user_id,))
+        await cur.execute("DELETE FROM ratings WHERE user_id=%s", (user_id,))
+        await cur.execute("DELETE FROM comments WHERE username=%s", (user,))
+        await cur.execute("DELETE FROM users WHERE id=%s", (user_id,))
                 
-        conn.commit()
+        await conn.commit()
+        taste.invalidate(user_id)
         
         request.session.clear()
         
         return {"message": "deleted"}
     except Exception as e:
         logging.error(f"Error deleting user: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
 
 
 @app.post("/update_comments")
 @app.get("/update_comments")
-async def update_comments(request: Request, comment: str = Query(...), movie_id: str = Query(...)):
+async def update_comments(request: Request, comment: str = Query(...), movie_id: str = Query(...), conn=Depends(get_conn)):
     user = request.session.get("user")
-    current_time = datetime.now().strftime("%d-%m-%Y")
     
     try:
         cur = conn.cursor()
         
-        cur.execute("INSERT INTO comments (username, comment_text, created_at, movie_id) VALUES (%s, %s, %s, %s)", (user, comment, current_time, movie_id))
+        await cur.execute("INSERT INTO comments (username, comment_text, created_at, movie_id) VALUES (%s, %s, now(), %s)", (user, comment, movie_id))
         
-        conn.commit()
-        cur.close()
+        await conn.commit()
+        await cur.close()
         
         return {"message": "added"}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
+
+COMMENTS_PAGE_MAX = 100
+
+def encode_cursor(created_at, comment_id):
+    raw = json.dumps([created_at.isoformat(), comment_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        created_at, comment_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(comment_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.get("/fetch_comments")
-async def fetch_comments(request: Request, movie_id: str = Query(...)):
+async def fetch_comments(request: Request, movie_id: str = Query(...),
+                         limit: int = Query(20, ge=1, le=COMMENTS_PAGE_MAX, description="Page size"),
+                         cursor: str | None = Query(None, description="next_cursor from the previous page"),
+                         conn=Depends(get_conn)):
     user = request.session.get("user")
     
+    # Keyset pagination on (created_at, id): newer comments don't shift the pages already handed out
+    if cursor:
+        created_at, comment_id = decode_cursor(cursor)
+        query = ("SELECT id, username, comment_text, created_at FROM comments WHERE movie_id=%s "
+                 "AND (created_at, id) < (%s, %s) ORDER BY created_at DESC, id DESC LIMIT %s")
+        params = (movie_id, created_at, comment_id, limit + 1)
+    else:
+        query = ("SELECT id, username, comment_text, created_at FROM comments WHERE movie_id=%s "
+                 "ORDER BY created_at DESC, id DESC LIMIT %s")
+        params = (movie_id, limit + 1)
+    
     try:
         cur = conn.cursor()
         
-        cur.execute("SELECT * FROM comments WHERE movie_id=%s ORDER BY created_at DESC", (movie_id,))
+        await cur.execute(query, params)
         
-        rows = cur.fetchall()
-        cur.close()
+        rows = await cur.fetchall()
+        await cur.close()
         
-        if rows:
-            comments = [{"username": row[1], "comment_text": row[2], "created_at": row[3]} for row in rows]
-            return {"comments": comments, "user": user}
-        return {"comments": [], "user": user}
+        page = rows[:limit]
+        next_cursor = encode_cursor(page[-1][3], page[-1][0]) if len(rows) > limit else None
+        comments = [{"username": row[1], "comment_text": row[2], "created_at": row[3].strftime("%d-%m-%Y")} for row in page]
+        return {"comments": comments, "user": user, "next_cursor": next_cursor}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
 
 @app.get("/fetch_rating")
-async def fetch_rating(request: Request, movie_id: str = Query(...)):
+async def fetch_rating(request: Request, movie_id: str = Query(...), conn=Depends(get_conn)):
     user = request.session.get("user_id")
     
     try:
         cur = conn.cursor()
         
-        cur.execute("SELECT rating FROM ratings WHERE user_id=%s AND movie_id=%s", (str(user), movie_id))
-        row = cur.fetchone()
+        await cur.execute("SELECT rating FROM ratings WHERE user_id=%s AND movie_id=%s", (user, movie_id))
+        row = await cur.fetchone()
         
-        cur.execute("SELECT avg_rating FROM avg_ratings WHERE movie_id=%s", (movie_id,))
-        row2 = cur.fetchone()
-        cur.close()
+        await cur.execute("SELECT avg_rating FROM avg_ratings WHERE movie_id=%s", (movie_id,))
+        row2 = await cur.fetchone()
+        await cur.close()
         
         if row:
             return {"rating": row[0], "avg_rating": row2[0]}
         return {"rating": 0, "avg_rating": row2[0] if row2 else 0}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
+
+# Serializes one user's rating writes. The upsert's `old` CTE reads a snapshot taken before it
+# waits on a concurrent insert of the same (user, movie), so without this lock two first-time
+# ratings would both count towards total_ratings. It must run as its own statement first.
+RATING_LOCK_SQL = "SELECT 1 FROM users WHERE id=%(user)s FOR UPDATE"
+
+# Upsert the rating and apply the delta to the movie's running sum/count in one statement,
+# so the average is maintained without rescanning ratings and concurrent raters can't race
+RATING_UPSERT_SQL = """
+WITH old AS (
+    SELECT rating FROM ratings WHERE user_id=%(user)s AND movie_id=%(movie_id)s FOR UPDATE
+), upsert AS (
+    INSERT INTO ratings (user_id, movie_id, rating) VALUES (%(user)s, %(movie_id)s, %(rating)s)
+    ON CONFLICT (user_id, movie_id) DO UPDATE SET rating = EXCLUDED.rating
+), delta AS (
+    SELECT %(rating)s - COALESCE((SELECT rating FROM old), 0) AS sum_delta,
+           CASE WHEN EXISTS (SELECT 1 FROM old) THEN 0 ELSE 1 END AS count_delta
+)
+INSERT INTO avg_ratings (movie_id, ratings_sum, total_ratings, avg_rating)
+    SELECT %(movie_id)s, sum_delta, count_delta, sum_delta / NULLIF(count_delta, 0) FROM delta
+    ON CONFLICT (movie_id)
+    DO UPDATE
+    SET ratings_sum = avg_ratings.ratings_sum + EXCLUDED.ratings_sum,
+        total_ratings = avg_ratings.total_ratings + EXCLUDED.total_ratings,
+        avg_rating = (avg_ratings.ratings_sum + EXCLUDED.ratings_sum) / NULLIF(avg_ratings.total_ratings + EXCLUDED.total_ratings, 0)
+    RETURNING avg_rating;
+"""
 
 @app.get("/update_user_rating")
 @app.post("/update_user_rating")
-async def update_user_rating(request: Request, movie_id: str = Query(...), rating: float = Query(...)):
+async def update_user_rating(request: Request, movie_id: str = Query(...), rating: float = Query(...), conn=Depends(get_conn)):
     user = request.session.get("user_id")
     
     try:
         cur = conn.cursor()
         
-        cur.execute("INSERT INTO ratings (user_id, movie_id, rating) VALUES (%s, %s, %s) ON CONFLICT (user_id, movie_id) DO UPDATE SET rating = EXCLUDED.rating", (user, movie_id, rating))
+        await cur.execute(RATING_LOCK_SQL, {"user": user})
+        await cur.execute(RATING_UPSERT_SQL, {"user": user, "movie_id": movie_id, "rating": rating})
         
-        conn.commit()
-        cur.close()
+        await conn.commit()
+        await cur.close()
+        taste.record_rating(user, movie_id, rating)
         
         return {"message": "rating updated"}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
 
+## Full recompute of a movie's average; ratings writes keep it current, so this is only for repairs
 @app.get("/update_avg_rating")
-async def update_avg_rating(movie_id: str = Query(...)):
-    ratings_sum = 0
-    total_ratings = 0
-    
+async def update_avg_rating(movie_id: str = Query(...), conn=Depends(get_conn)):
     try:
         cur = conn.cursor()
         
-        cur.execute("SELECT rating FROM ratings WHERE movie_id=%s", (movie_id,))
-        
-        rows = cur.fetchall()
-        if rows:
-            for row in rows:
-                ratings_sum += row[0]
-                total_ratings += 1
-            
-        avg_rating = ratings_sum / total_ratings if total_ratings > 0 else 0
-        
-        cur.execute("""
+        await cur.execute("""
         INSERT INTO avg_ratings (movie_id, ratings_sum, total_ratings, avg_rating) 
-            VALUES (%s, %s, %s, %s)
+            SELECT %(movie_id)s, COALESCE(SUM(rating), 0), COUNT(*), COALESCE(AVG(rating), 0)
+            FROM ratings WHERE movie_id=%(movie_id)s
             ON CONFLICT (movie_id) 
             DO UPDATE 
             SET ratings_sum = EXCLUDED.ratings_sum,
                 total_ratings = EXCLUDED.total_ratings,
-                avg_rating = (EXCLUDED.ratings_sum) / (EXCLUDED.total_ratings);
-        """, (movie_id, ratings_sum, total_ratings, avg_rating)) 
+                avg_rating = EXCLUDED.avg_rating;
+        """, {"movie_id": movie_id}) 
         
-        conn.commit()
-        cur.close()
+        await conn.commit()
+        await cur.close()
         
         return {"message": "average rating updated"}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
             
+## Batch Write Endpoints
+# Bulk UI actions (importing a watchlist, rating a backlog) send one JSON array and get one
+# transaction; psycopg pipelines the executemany so the batch costs a single commit.
+BATCH_MAX = int(os.getenv("BATCH_MAX", 200))
+
+class WatchlistItem(BaseModel):
+    title: str
+    poster_path: str
+    genres: str
+    id: str | None = None
+
+class RatingItem(BaseModel):
+    movie_id: str
+    rating: float
+
+class CommentItem(BaseModel):
+    comment: str
+    movie_id: str
+
+class WatchlistBatchBody(BaseModel):
+    items: list[WatchlistItem] = Field(..., min_length=1, max_length=BATCH_MAX)
+
+class RatingBatchBody(BaseModel):
+    items: list[RatingItem] = Field(..., min_length=1, max_length=BATCH_MAX)
+
+class CommentBatchBody(BaseModel):
+    items: list[CommentItem] = Field(..., min_length=1, max_length=BATCH_MAX)
+
+async def run_batch(query, params, returning=False, lock=None):
+    """executemany in one transaction; with returning=True yields each item's result rows.
+
+    lock is an optional (query, params) run first in the same transaction. The connection
+    is only checked out for the SQL itself.
+    """
+    async with connection() as conn:
+        try:
+            async with conn.cursor() as cur:
+                if lock is not None:
+                    await cur.execute(*lock)
+                await cur.executemany(query, params, returning=returning)
+                results = []
+                if returning:
+                    while True:
+                        results.append(await cur.fetchall())
+                        if not cur.nextset():
+                            break
+            await conn.commit()
+            return results
+        except Exception as e:
+            logging.error(f"Error during batch write: {e}")
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail="Database error")
+
+@app.post("/add_to_watchlist_batch")
+async def add_to_watchlist_batch(request: Request, body: WatchlistBatchBody):
+    user = request.session.get("user_id")
+    
+    await run_batch(
+        'INSERT INTO watchlist (title, poster_path, genres, movie_id, user_id) VALUES (%s, %s, %s, %s, %s)',
+        [(item.title, item.poster_path, item.genres, item.id, user) for item in body.items],
+    )
+    for item in body.items:
+        taste.record_watchlist(user, item.id)
+    return {"results": [{"index": i, "message": "added"} for i in range(len(body.items))]}
+
+@app.post("/remove_from_watchlist_batch")
+async def remove_from_watchlist_batch(request: Request, body: WatchlistBatchBody):
+    user = request.session.get("user_id")
+    
+    deleted = await run_batch(
+        'DELETE FROM watchlist WHERE title=%s AND poster_path=%s AND genres=%s AND user_id=%s RETURNING 1',
+        [(item.title, item.poster_path, item.genres, user) for item in body.items],
+        returning=True,
+    )
+    taste.invalidate(user)
+    return {"results": [
+        {"index": i, "message": "removed" if rows else "not found"} for i, rows in enumerate(deleted)
+    ]}
+
+@app.post("/update_user_rating_batch")
+async def update_user_rating_batch(request: Request, body: RatingBatchBody):
+    user = request.session.get("user_id")
+    
+    updated = await run_batch(
+        RATING_UPSERT_SQL,
+        [{"user": user, "movie_id": item.movie_id, "rating": item.rating} for item in body.items],
+        returning=True,
+        lock=(RATING_LOCK_SQL, {"user": user}),
+    )
+    for item in body.items:
+        taste.record_rating(user, item.movie_id, item.rating)
+    return {"results": [
+        {"index": i, "message": "rating updated", "avg_rating": rows[0][0]} for i, rows in enumerate(updated)
+    ]}
+
+@app.post("/update_comments_batch")
+async def update_comments_batch(request: Request, body: CommentBatchBody):
+    user = request.session.get("user")
+    
+    await run_batch(
+        "INSERT INTO comments (username, comment_text, created_at, movie_id) VALUES (%s, %s, now(), %s)",
+        [(user, item.comment, item.movie_id) for item in body.items],
+    )
+    return {"results": [{"index": i, "message": "added"} for i in range(len(body.items))]}
+            
+class PresignBody(BaseModel):
+    filename: str
+    content_type: str
+
+class CompleteUploadBody(BaseModel):
+    key: str
+
+## Direct-to-S3 profile picture upload: presign, browser POSTs the file to S3, then complete
+@app.post("/presign_profile_pic")
+async def presign_profile_pic(request: Request, body: PresignBody):
+    username = request.session.get("user")
+    if not username:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    if body.content_type not in uploads.ALLOWED_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported image type")
+    
+    return await executors.io.run(uploads.presign_upload, username, body.filename, body.content_type)
+
+@app.post("/complete_profile_pic")
+async def complete_profile_pic(request: Request, body: CompleteUploadBody):
+    username = request.session.get("user")
+    if not username:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    if not body.key.startswith(uploads.user_prefix(username)):
+        raise HTTPException(status_code=403, detail="Upload does not belong to this user")
+    
+    try:
+        head = await executors.io.run(lambda: s3.head_object(Bucket=BUCKET, Key=body.key))
+    except Exception:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if head["ContentLength"] > uploads.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Profile picture is too large")
+    
+    profile_pic_url = uploads.object_url(body.key)
+    async with connection() as conn:
+        try:
+            cur = conn.cursor()
+        
+            await cur.execute(
+            "UPDATE users SET profile_pic=%s, profile_pic_variants=NULL WHERE username=%s",
+            (profile_pic_url, username)
+            )
+        
+            await conn.commit()
+            await cur.close()
+        except Exception as e:
+            logging.error(f"Error during user search: {e}")
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail="Database error")
+        finally:
+            if 'cur' in locals() and not cur.closed:
+                await cur.close()
+    
+    uploads.enqueue_variants(username, body.key)
+    return {"profile_pic": profile_pic_url}
+
 @app.get("/fetch_profile_pic")
-async def fetch_profile_pic(request: Request):
+async def fetch_profile_pic(request: Request, size: str = Query("original", description="original, medium or thumb"), conn=Depends(get_conn)):
     username = request.session.get("user")
     try:
         
         cur = conn.cursor()
         
-        cur.execute(
-        "SELECT profile_pic FROM users WHERE username=%s",
+        await cur.execute(
+        "SELECT profile_pic, profile_pic_variants FROM users WHERE username=%s",
         (username,)
         )
         
-        row = cur.fetchone()
+        row = await cur.fetchone()
         
         if row is None:
             return {"profile_pic": "https://cdn-icons-png.flaticon.com/512/149/149071.png"}
         
-        profile_pic_url = row[0]
-        return {"profile_pic": profile_pic_url}
+        # Resized variants appear once the upload worker has made them; until then serve the original
+        profile_pic_url, variants = row
+        return {"profile_pic": (variants or {}).get(size, profile_pic_url)}
     except Exception as e:
         logging.error(f"Error during user search: {e}")
-        conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail="Database error")
     finally:
         if 'cur' in locals() and not cur.closed:
-            cur.close()
+            await cur.close()
             
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5050))
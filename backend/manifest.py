@@ -0,0 +1,104 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+# `<index>.manifest.json` records, per index row, the TMDB id and content hash it was built
+# from ([id, hash], or null once tombstoned), so an incremental build only embeds movies
+# that are new or changed. It is written into the build directory with everything else the
+# build produced, and the build goes live when its directory is published.
+
+
+def manifest_path(index_path):
+    return f"{os.path.splitext(index_path)[0]}.manifest.json"
+
+
+def content_hash(model_name, *parts):
+    return hashlib.sha256(json.dumps([model_name, *parts], default=str).encode("utf-8")).hexdigest()
+
+
+def load_manifest(index_path):
+    try:
+        with open(manifest_path(index_path), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def dead_rows(manifest, n):
+    """Boolean mask of tombstoned index rows"""
+    dead = np.zeros(n, dtype=bool)
+    if manifest is not None:
+        rows = manifest["rows"][:n]
+        dead[: len(rows)] = [row is None for row in rows]
+    return dead
+
+
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def save_npy_atomic(path, array):
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def build_versions(path):
+    """Versions of the `<path>.v<N>` build directories on disk"""
+    parent = os.path.dirname(os.path.abspath(path))
+    prefix = f"{os.path.basename(path)}.v"
+    return [
+        int(name[len(prefix):])
+        for name in os.listdir(parent)
+        if name.startswith(prefix) and name[len(prefix):].isdigit()
+    ]
+
+
+def next_version(manifest, build_path):
+    """One past the live manifest's version and every build directory already written, so a
+    version number (and its directory) is never reused, even after an interrupted build"""
+    return max([manifest["version"] if manifest else 0, *build_versions(build_path)]) + 1
+
+
+def stage_build(path, version):
+    """Empty `<path>.v<version>.tmp` directory to write a build into before publish_build"""
+    target = f"{path}.v{version}"
+    if os.path.exists(target):
+        raise FileExistsError(f"{target} already exists, build versions are never reused")
+    staging = f"{target}.tmp"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+    return staging
+
+
+def publish_build(path, version):
+    """Rename the staged build to `<path>.v<version>` and flip the `path` symlink to it.
+
+    The index, vectors, catalog, lookups, neighbour table and manifest all live in that one
+    directory, so the flip swaps them together and a reader that resolved the symlink never
+    mixes two builds. A running API keeps reading the directory it resolved until it reloads;
+    the previous version is kept for it and older ones are removed.
+    """
+    target = f"{path}.v{version}"
+    os.rename(f"{target}.tmp", target)
+
+    # The directory the API may still be reading, kept until the next build
+    previous = os.readlink(path) if os.path.islink(path) else None
+    link_tmp = f"{path}.tmp"
+    if os.path.lexists(link_tmp):
+        os.remove(link_tmp)
+    os.symlink(os.path.basename(target), link_tmp)
+    os.replace(link_tmp, path)
+
+    keep = {os.path.basename(target), previous}
+    parent = os.path.dirname(os.path.abspath(path))
+    prefix = f"{os.path.basename(path)}.v"
+    for name in os.listdir(parent):
+        if name.startswith(prefix) and name not in keep:
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import argparse
+import psycopg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Config ---
+DATABASE_URL = os.getenv("DATABASE_URL")
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Representative endpoint queries that must be index-backed (see `--check`)
+ENDPOINT_QUERIES = {
+    "/check_watchlist": ("SELECT EXISTS(SELECT 1 FROM watchlist WHERE poster_path=%s AND user_id=%s)", ("/p.jpg", 1)),
+    "/get_watchlist": ("SELECT * FROM watchlist WHERE user_id=%s", (1,)),
+    "/remove_from_watchlist": (
+        "DELETE FROM watchlist WHERE title=%s AND poster_path=%s AND genres=%s AND user_id=%s",
+        ("t", "/p.jpg", "g", 1),
+    ),
+    "/fetch_rating": ("SELECT rating FROM ratings WHERE user_id=%s AND movie_id=%s", (1, "1")),
+    "/fetch_rating avg": ("SELECT avg_rating FROM avg_ratings WHERE movie_id=%s", ("1",)),
+    "/get_user_stats": ("SELECT COUNT(*), MAX(rating) FROM ratings WHERE user_id=%s", (1,)),
+    "/update_avg_rating": ("SELECT SUM(rating), COUNT(*) FROM ratings WHERE movie_id=%s", ("1",)),
+    "/fetch_comments": (
+        "SELECT id, username, comment_text, created_at FROM comments WHERE movie_id=%s "
+        "AND (created_at, id) < (%s, %s) ORDER BY created_at DESC, id DESC LIMIT %s",
+        ("1", "2025-01-01T00:00:00+00:00", 1, 21),
+    ),
+    "/delete_user comments": ("DELETE FROM comments WHERE username=%s", ("u",)),
+}
+
+
+def migration_files():
+    return sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+
+
+def applied_versions(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations (version TEXT PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+    )
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def migrate(conn):
+    """Apply pending migrations in filename order, each in its own transaction"""
+    done = applied_versions(conn)
+    conn.commit()
+
+    for filename in migration_files():
+        version = filename.split("_", 1)[0]
+        if version in done:
+            continue
+
+        print(f"🔹 Applying {filename}")
+        with open(os.path.join(MIGRATIONS_DIR, filename), "r") as f:
+            sql = f.read()
+        with conn.transaction():
+            conn.execute(sql)
+            conn.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+
+
+def seq_scans(plan):
+    """Tables read with a sequential scan anywhere in an EXPLAIN (FORMAT JSON) plan"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def check(conn):
+    """EXPLAIN each endpoint query; fails if any still needs a sequential scan"""
+    failures = 0
+    with conn.transaction():
+        # Small tables make seq scans look cheapest; only ask whether an index path exists
+        conn.execute("SET LOCAL enable_seqscan = off")
+        for endpoint, (sql, params) in ENDPOINT_QUERIES.items():
+            with conn.cursor() as cur:
+                cur.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cur.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            scans = seq_scans(plan[0]["Plan"])
+            if scans:
+                failures += 1
+                print(f"❌ {endpoint}: sequential scan on {', '.join(scans)}")
+            else:
+                print(f"✅ {endpoint}")
+        # EXPLAIN of a DELETE doesn't execute it, but never keep anything from the check
+        raise psycopg.Rollback()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations and check endpoint queries use indexes")
+    parser.add_argument("--check", action="store_true", help="only run the EXPLAIN index check")
+    args = parser.parse_args()
+
+    with psycopg.connect(DATABASE_URL, cursor_factory=psycopg.ClientCursor) as conn:
+        if not args.check:
+            migrate(conn)
+        sys.exit(1 if check(conn) else 0)
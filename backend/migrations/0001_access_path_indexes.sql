@@ -0,0 +1,23 @@
+-- Indexes for the access paths used by main.py
+
+-- /check_watchlist, /remove_from_watchlist and /get_watchlist (user_id prefix)
+CREATE INDEX IF NOT EXISTS watchlist_user_poster_idx ON watchlist (user_id, poster_path);
+
+-- /fetch_rating and /get_user_stats are served by the (user_id, movie_id) unique key
+-- that ON CONFLICT in /update_user_rating relies on; create it only if it's missing.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE tablename = 'ratings' AND indexdef LIKE 'CREATE UNIQUE INDEX % (user_id, movie_id)'
+    ) THEN
+        CREATE UNIQUE INDEX ratings_user_movie_key ON ratings (user_id, movie_id);
+    END IF;
+END $$;
+
+-- /update_avg_rating recompute
+CREATE INDEX IF NOT EXISTS ratings_movie_idx ON ratings (movie_id);
+
+-- /fetch_comments ordered by created_at, /delete_user by username
+CREATE INDEX IF NOT EXISTS comments_movie_created_idx ON comments (movie_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS comments_username_idx ON comments (username);
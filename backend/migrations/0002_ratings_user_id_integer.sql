@@ -0,0 +1,3 @@
+-- ratings.user_id was text while users.id and watchlist.user_id are integers, so queries
+-- had to bind str(user_id); store it as an integer like the other tables.
+ALTER TABLE ratings ALTER COLUMN user_id TYPE INTEGER USING user_id::integer;
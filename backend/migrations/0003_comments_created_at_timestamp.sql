@@ -0,0 +1,7 @@
+-- created_at was stored as a "%d-%m-%Y" string, which sorts lexicographically;
+-- store a real timestamp and index it with id as a tie-breaker for keyset pagination.
+ALTER TABLE comments ALTER COLUMN created_at TYPE TIMESTAMPTZ USING to_timestamp(created_at, 'DD-MM-YYYY');
+ALTER TABLE comments ALTER COLUMN created_at SET DEFAULT now();
+
+DROP INDEX IF EXISTS comments_movie_created_idx;
+CREATE INDEX IF NOT EXISTS comments_movie_created_id_idx ON comments (movie_id, created_at DESC, id DESC);
@@ -0,0 +1,3 @@
+-- Resized profile picture URLs keyed by variant name ({"thumb": ..., "medium": ...}),
+-- filled in by the upload worker once the thumbnails exist.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_pic_variants JSONB;
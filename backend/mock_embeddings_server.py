@@ -0,0 +1,97 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# OpenAI-compatible /v1/embeddings stand-in for exercising the offline build without spending
+# API quota. Vectors are deterministic per text, and rate limits, server errors and rejected
+# inputs can be injected:
+#
+#   python mock_embeddings_server.py --rpm 120 --error-rate 0.05 --reject BADTEXT
+#   OPENAI_API_KEY=x OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python precompute_embeddings.py
+#
+# GET /stats returns request and rejection counters.
+
+parser = argparse.ArgumentParser(description="Mock OpenAI embeddings server")
+parser.add_argument("--port", type=int, default=8765)
+parser.add_argument("--dim", type=int, default=1536)
+parser.add_argument("--rpm", type=int, default=0, help="answer 429 above this many requests per minute (0 = unlimited)")
+parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+parser.add_argument("--reject", action="append", default=[], help="answer 400 to batches containing this substring")
+parser.add_argument("--latency", type=float, default=0.05, help="seconds per request")
+args = parser.parse_args()
+
+lock = threading.Lock()
+recent = []
+stats = {"requests": 0, "texts": 0, "rate_limited": 0, "errors": 0, "rejected": 0}
+
+
+def vector(text):
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    vec = np.random.default_rng(seed).standard_normal(args.dim)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *_):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def error(self, status, message, counter, headers=None):
+        with lock:
+            stats[counter] += 1
+        self.send_json(status, {"error": {"message": message, "type": counter}}, headers)
+
+    def do_GET(self):
+        with lock:
+            self.send_json(200, stats)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        time.sleep(args.latency)
+
+        with lock:
+            now = time.monotonic()
+            recent[:] = [t for t in recent if now - t < 60]
+            limited = args.rpm and len(recent) >= args.rpm
+            if limited:
+                retry_after = 60 - (now - recent[0])
+            else:
+                recent.append(now)
+        if limited:
+            return self.error(429, "Rate limit reached", "rate_limited", {"Retry-After": f"{retry_after:.2f}"})
+        if random.random() < args.error_rate:
+            return self.error(500, "Internal server error", "errors")
+        if any(bad in text for text in texts for bad in args.reject):
+            return self.error(400, "Invalid input", "rejected")
+
+        with lock:
+            stats["requests"] += 1
+            stats["texts"] += len(texts)
+        data = [{"object": "embedding", "index": i, "embedding": vector(text)} for i, text in enumerate(texts)]
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        self.send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+if __name__ == "__main__":
+    print(f"🔹 Mock embeddings on http://127.0.0.1:{args.port}/v1")
+    ThreadingHTTPServer(("127.0.0.1", args.port), Handler).serve_forever()
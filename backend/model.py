@@ -1,44 +1,338 @@
 import os
 import faiss
 import numpy as np
-import pandas as pd
-import openai
 import json
+import asyncio
+import logging
+from typing import NamedTuple
+from catalog import Catalog, records_from_json
+from embedding_cache import EmbeddingCache, content_key
+from embeddings import BACKEND, get_backend, build_path, live_paths
+import ann_index
+import neighbors
+from content_filter import catalog_filter
+from manifest import load_manifest, dead_rows
+import executors
 
 alpha = 0.6
 beta = 0.4
 
-# Load precomputed data
-with open("movies_precomputed.json", "r") as f:
-    data = json.load(f)
+# Query-time knobs for approximate indexes (ignored by the flat index)
+NPROBE = ann_index.NPROBE
+EF_SEARCH = ann_index.EF_SEARCH
+# Extra neighbours fetched so content-filtered results still fill top_k
+FILTER_HEADROOM = int(os.getenv("FILTER_HEADROOM", 10))
+# Reciprocal-rank fusion constant; larger values flatten the advantage of top ranks
+RRF_K = int(os.getenv("RRF_K", 60))
 
-movies = pd.DataFrame.from_dict(data, orient="index")
-index = faiss.read_index("movie_index.faiss")
+# Each embedding backend searches its own build: a directory holding its index, row-aligned
+# catalog, lookups and neighbour table (see precompute_embeddings.py --backend)
+BUILD_PATH = build_path(BACKEND)
+INDEX_RELOAD_INTERVAL = int(os.getenv("INDEX_RELOAD_INTERVAL", 30))
+_watcher = None
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+class Build(NamedTuple):
+    """Everything one build wrote, loaded together. It is swapped in as a single reference,
+    so a request that takes `build = model.current` once never mixes two builds' rows."""
 
-def get_openai_embedding(text):
-    """Embed text using OpenAI instead of SentenceTransformer"""
-    response = openai.embeddings.create(
-        input=text,
-        model="text-embedding-3-small"
+    version: int | None
+    movies: Catalog
+    titles_by_row: np.ndarray
+    ids_by_row: np.ndarray
+    hidden: np.ndarray
+    dead: np.ndarray
+    vectors: np.ndarray | None
+    title_to_id: dict
+    id_to_row: dict
+    neighbor_table: tuple | None
+    index: faiss.Index
+
+def load_build():
+    """Everything a build writes, read in one go so a reload can swap it in whole.
+
+    Every file comes from the build directory the symlink pointed at when this started, so a
+    build published mid-load can't mix its rows into this one.
+    """
+    index_path, vectors_path, catalog_path, lookup_path = live_paths(BACKEND)
+
+    # The memory-mapped catalog, or the JSON export if it hasn't been built
+    if os.path.isdir(catalog_path):
+        catalog = Catalog.open(os.path.realpath(catalog_path))
+    else:
+        catalog = Catalog.from_records(records_from_json("movies_precomputed.json"))
+
+    # Stored combined vectors (row-aligned with the index), memory-mapped if the sidecar exists
+    stored = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None
+
+    # Title -> TMDB id and id -> row lookups written by precompute_embeddings.py
+    lookup = {"title_to_id": {}, "id_to_row": {}}
+    if os.path.exists(lookup_path):
+        with open(lookup_path, "r") as f:
+            lookup = json.load(f)
+
+    # Precomputed top-k neighbours per catalog row, ignored if it doesn't match the catalog
+    table = neighbors.load(index_path)
+    if table is not None and len(table[0]) != len(catalog):
+        table = None
+
+    manifest = load_manifest(index_path)
+    dead = dead_rows(manifest, len(catalog))
+    titles_by_row, ids_by_row, hidden = derived_arrays(catalog, dead)
+    return Build(
+        version=manifest["version"] if manifest else None,
+        movies=catalog,
+        titles_by_row=titles_by_row,
+        ids_by_row=ids_by_row,
+        hidden=hidden,
+        dead=dead,
+        vectors=stored,
+        title_to_id=lookup["title_to_id"],
+        id_to_row=lookup["id_to_row"],
+        neighbor_table=table,
+        index=faiss.read_index(index_path),
+    )
+
+def install(build):
+    """Swap a loaded build in; a request that already took the old one keeps using it"""
+    global current
+    current = build
+
+def live_build():
+    """The build directory the symlink points at, or None before the first build"""
+    return os.path.realpath(BUILD_PATH) if os.path.isdir(BUILD_PATH) else None
+
+def reload_if_changed():
+    """Hot-swap to a newer build once the build symlink has been flipped to it"""
+    global loaded_build
+    target = live_build()
+    if target is None or target == loaded_build:
+        return False
+    build = load_build()
+    loaded_build = target
+    install(build)
+    return True
+
+async def watch_builds():
+    while True:
+        await asyncio.sleep(INDEX_RELOAD_INTERVAL)
+        try:
+            if await executors.io.run(reload_if_changed):
+                logging.info(f"Loaded index build {current.version}")
+        except Exception as e:
+            logging.error(f"Error reloading index build: {e}")
+
+def start():
+    global _watcher
+    _watcher = asyncio.create_task(watch_builds())
+
+async def stop():
+    if _watcher is not None:
+        _watcher.cancel()
+        try:
+            await _watcher
+        except asyncio.CancelledError:
+            pass
+
+embedder = get_backend(BACKEND)
+embedding_cache = EmbeddingCache()
+
+def normalize_title(title):
+    return " ".join(str(title).split()).casefold()
+
+def lookup_id(title, build=None):
+    """TMDB id for a catalog title, or None if the title isn't in the catalog"""
+    build = build or current
+    return build.title_to_id.get(normalize_title(title))
+
+def lookup_row(movie_id, build=None):
+    """Index row for a TMDB id, or None if the movie isn't in the catalog"""
+    build = build or current
+    return build.id_to_row.get(str(movie_id))
+
+def title_for_id(movie_id, build=None):
+    """Catalog title for a TMDB id, or None if the movie isn't in the catalog"""
+    build = build or current
+    row = lookup_row(movie_id, build)
+    return None if row is None else build.movies.title(row)
+
+def stored_vector(row, build=None):
+    """Combined vector for an index row, from the sidecar or reconstructed from the index"""
+    build = build or current
+    if build.vectors is not None:
+        return np.array(build.vectors[row], dtype="float32")
+    return build.index.reconstruct(int(row))
+
+def stored_vectors(rows, build=None):
+    """(N, d) matrix of stored vectors for index rows, gathered in one call"""
+    build = build or current
+    rows = np.asarray(rows, dtype="int64")
+    if build.vectors is not None:
+        return np.ascontiguousarray(build.vectors[rows], dtype="float32")
+    return build.index.reconstruct_batch(rows)
+
+def derived_arrays(catalog, dead):
+    """Title and TMDB id arrays indexed by row, so top-k results are a single fancy index, and
+    the mask of rows never returned: content-filtered or tombstoned"""
+    n = len(catalog)
+    titles = catalog.column("title")
+    overviews = catalog.column("overview")
+    blocked = np.fromiter(
+        (catalog_filter.blocked_text(f"{titles[i]}\n{overviews[i]}") for i in range(n)),
+        dtype=bool,
+        count=n,
     )
-    return np.array(response.data[0].embedding, dtype="float32")
+    return (
+        np.array(titles.take(range(n)), dtype=object),
+        np.array(catalog.column("id").take(range(n)), dtype=object),
+        blocked | dead,
+    )
+
+def search_batch(query_vecs, top_k=50, nprobe=NPROBE, ef_search=EF_SEARCH, filtered=True, exclude=None, build=None):
+    """Search an (N, d) query matrix in one call; returns titles, scores and ids per query.
+
+    FAISS pads missing neighbours with -1, those slots are dropped, as are rows the
+    content filter blocks when filtered=True and any index rows listed in exclude.
+    """
+    build = build or current
+    query_vecs = np.ascontiguousarray(query_vecs, dtype="float32")
+    exclude = np.fromiter(exclude, dtype="int64") if exclude else None
+    fetch_k = top_k + (FILTER_HEADROOM if filtered else 0) + (len(exclude) if exclude is not None else 0)
+    fetch_k = min(fetch_k, build.index.ntotal)
+    scores, indices = ann_index.search(build.index, query_vecs, fetch_k, nprobe=nprobe, ef_search=ef_search)
+
+    valid = indices >= 0
+    safe = np.where(valid, indices, 0)
+    valid &= ~(build.hidden if filtered else build.dead)[safe]
+    if exclude is not None:
+        valid &= ~np.isin(indices, exclude)
+    title_rows = build.titles_by_row[safe]
+    id_rows = build.ids_by_row[safe]
+
+    return [
+        {
+            "titles": title_rows[q][valid[q]][:top_k].tolist(),
+            "scores": scores[q][valid[q]][:top_k].tolist(),
+            "ids": id_rows[q][valid[q]][:top_k].tolist(),
+        }
+        for q in range(len(indices))
+    ]
+
+def search(query_vec, top_k=50, nprobe=NPROBE, ef_search=EF_SEARCH):
+    return search_batch(query_vec, top_k, nprobe=nprobe, ef_search=ef_search)[0]["titles"]
+
+def table_hits(row, top_k, build):
+    """Hits for a catalog row straight from the neighbour table, filtered like search_batch"""
+    neighbor_rows = np.asarray(build.neighbor_table[0][row], dtype="int64")
+    scores = np.asarray(build.neighbor_table[1][row], dtype="float32")
+    valid = neighbor_rows >= 0
+    safe = np.where(valid, neighbor_rows, 0)
+    valid &= ~build.hidden[safe]
+
+    keep = safe[valid][:top_k]
+    return {
+        "titles": build.titles_by_row[keep].tolist(),
+        "scores": scores[valid][:top_k].tolist(),
+        "ids": build.ids_by_row[keep].tolist(),
+    }
+
+def recommend_by_id(movie_id, top_k=50, nprobe=NPROBE, ef_search=EF_SEARCH, build=None):
+    """Hits for a catalog movie's stored vector with no network calls, or None if not in the catalog"""
+    build = build or current
+    row = lookup_row(movie_id, build)
+    if row is None:
+        return None
+
+    if build.neighbor_table is not None and top_k <= build.neighbor_table[0].shape[1]:
+        return table_hits(row, top_k, build)
+
+    query_vec = np.expand_dims(stored_vector(row, build), axis=0)
+    return search_batch(query_vec, top_k, nprobe=nprobe, ef_search=ef_search, build=build)[0]
 
-def vectorize(searched, top_k=50):
+def recommend_by_ids(movie_ids, top_k=50, nprobe=NPROBE, ef_search=EF_SEARCH, query_vecs=None, build=None):
+    """recommend_by_id for many movies with one index.search over an (N, d) query matrix.
+
+    Catalog movies use their stored vectors; off-catalog ids can supply one in query_vecs
+    ({movie_id: vector}). Hits come back in input order, None for ids with no vector, and
+    catalog query movies are excluded from every result.
+    """
+    build = build or current
+    query_vecs = query_vecs or {}
+    rows = [lookup_row(movie_id, build) for movie_id in movie_ids]
+    catalog_rows = [row for row in rows if row is not None]
+    stored = iter(stored_vectors(catalog_rows, build)) if catalog_rows else iter(())
+
+    matrix = []
+    for movie_id, row in zip(movie_ids, rows):
+        vec = next(stored) if row is not None else query_vecs.get(movie_id)
+        if vec is not None:
+            matrix.append(vec)
+    if not matrix:
+        return [None] * len(movie_ids)
+
+    hits = iter(search_batch(np.stack(matrix), top_k, nprobe=nprobe, ef_search=ef_search, exclude=catalog_rows, build=build))
+    return [
+        next(hits) if row is not None or query_vecs.get(movie_id) is not None else None
+        for movie_id, row in zip(movie_ids, rows)
+    ]
+
+def fuse(results, top_k=50, k=RRF_K):
+    """Merge per-query hits with reciprocal-rank fusion: sum 1 / (k + rank) per movie id"""
+    fused = {}
+    titles = {}
+    for hits in results:
+        for rank, (movie_id, title) in enumerate(zip(hits["ids"], hits["titles"])):
+            fused[movie_id] = fused.get(movie_id, 0.0) + 1.0 / (k + rank + 1)
+            titles[movie_id] = title
+
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return {
+        "titles": [titles[movie_id] for movie_id, _ in ranked],
+        "scores": [score for _, score in ranked],
+        "ids": [movie_id for movie_id, _ in ranked],
+    }
+
+def get_embeddings(texts):
+    """Embed a list of texts in a single backend call, skipping any already cached"""
+    keys = [content_key(embedder.model_name, text) for text in texts]
+    vecs = [embedding_cache.get(key) for key in keys]
+    missing = [i for i, vec in enumerate(vecs) if vec is None]
+
+    if missing:
+        embedded = embedder.embed([texts[i] for i in missing])
+        for i, vec in zip(missing, embedded):
+            vecs[i] = vec
+            embedding_cache.set(keys[i], vec)
+
+    return np.stack(vecs)
+
+def get_embedding(text):
+    """Embed text with the configured backend, cached by content hash"""
+    return get_embeddings([text])[0]
+
+def query_texts(searched):
     # Combine user query the same way you did locally
     query_text = f"Genres: {searched['genres']}. Director: {searched['director']}. Cast: {searched['cast']}."
-    overview_text = searched.get("overview", "")
+    overview_text = searched.get("overview") or "No overview available"
+    return overview_text, query_text
+
+def embed_queries(searched_list):
+    """Normalized query vectors for N movies, embedding all 2N text parts in one request"""
+    texts = []
+    for searched in searched_list:
+        texts.extend(query_texts(searched))
 
-    # Get OpenAI embeddings for query parts
-    overview_vec = get_openai_embedding(overview_text)
-    feature_vec = get_openai_embedding(query_text)
+    embeddings = get_embeddings(texts)
+    overview_vecs = embeddings[0::2]
+    feature_vecs = embeddings[1::2]
 
-    query_vec = alpha * overview_vec + beta * feature_vec
-    query_vec = np.expand_dims(query_vec, axis=0)
-    faiss.normalize_L2(query_vec)
+    query_vecs = (alpha * overview_vecs + beta * feature_vecs).astype("float32")
+    faiss.normalize_L2(query_vecs)
+    return query_vecs
 
-    scores, indices = index.search(query_vec, top_k)
+def vectorize(searched, top_k=50, nprobe=NPROBE, ef_search=EF_SEARCH):
+    query_vec = embed_queries([searched])
+    return search(query_vec, top_k, nprobe=nprobe, ef_search=ef_search)
 
-    best = indices[0]
-    return [movies.iloc[i]['title'] for i in best]
+# Load the current build
+loaded_build = live_build()
+current = load_build()
@@ -0,0 +1,136 @@
+import os
+import shutil
+import argparse
+import faiss
+import numpy as np
+import ann_index
+from manifest import save_npy_atomic, write_json_atomic, load_manifest, manifest_path, next_version, stage_build, publish_build
+
+# All-pairs top-k table for the catalog: row i of `<index>.neighbors.ids.npy` (int32) holds
+# the index rows of movie i's nearest neighbours, best first and padded with -1, and
+# `<index>.neighbors.scores.npy` (float16) their similarities. Both are memory-mapped, so a
+# catalog recommendation is one row read instead of an index.search.
+KNN_K = int(os.getenv("KNN_K", 60))
+SEARCH_BATCH = 4096
+
+
+def neighbor_paths(index_path):
+    stem = os.path.splitext(index_path)[0]
+    return f"{stem}.neighbors.ids.npy", f"{stem}.neighbors.scores.npy"
+
+
+def search_rows(index, vectors, rows, k, nprobe=ann_index.NPROBE, ef_search=ann_index.EF_SEARCH):
+    """Top-k neighbours for the given index rows, searched in (SEARCH_BATCH, d) blocks.
+
+    Uses the same nprobe/efSearch as live searches by default; with FAISS's defaults (nprobe=1)
+    an IVF table would be far less accurate than the search it stands in for.
+    """
+    ids = np.full((len(rows), k), -1, dtype="int32")
+    scores = np.zeros((len(rows), k), dtype="float16")
+    k = min(k, index.ntotal)
+    for start in range(0, len(rows), SEARCH_BATCH):
+        block = rows[start : start + SEARCH_BATCH]
+        queries = np.ascontiguousarray(vectors[block], dtype="float32")
+        block_scores, block_ids = ann_index.search(index, queries, k, nprobe=nprobe, ef_search=ef_search)
+        # Unfilled slots come back as id -1 with -FLT_MAX, which doesn't fit in float16
+        block_scores[block_ids < 0] = 0
+        ids[start : start + len(block), :k] = block_ids
+        scores[start : start + len(block), :k] = block_scores
+    return ids, scores
+
+
+def build_table(index, vectors, k=KNN_K, nprobe=ann_index.NPROBE, ef_search=ann_index.EF_SEARCH):
+    return search_rows(index, vectors, np.arange(len(vectors)), k, nprobe=nprobe, ef_search=ef_search)
+
+
+def rows_to_refresh(vectors, ids, scores, changed_rows=(), chunk=65536):
+    """Existing rows whose top-k can differ after rows >= len(ids) were appended or changed_rows edited.
+
+    A row is affected if a new vector beats its current k-th score, or if an edited row is
+    currently one of its neighbours.
+    """
+    old_n, k = ids.shape
+    new = np.ascontiguousarray(vectors[old_n:], dtype="float32")
+    changed = np.asarray(sorted(changed_rows), dtype="int32")
+    # Scores are float16, so compare with a margin rather than miss a near-tie
+    kth = scores[:, -1].astype("float32") - 1e-3
+    kth[ids[:, -1] < 0] = -np.inf  # rows with padding accept any neighbour
+
+    affected = np.zeros(old_n, dtype=bool)
+    for start in range(0, old_n, chunk):
+        end = min(start + chunk, old_n)
+        if len(new):
+            block = np.asarray(vectors[start:end], dtype="float32")
+            affected[start:end] |= (block @ new.T > kth[start:end, None]).any(axis=1)
+        if len(changed):
+            affected[start:end] |= np.isin(ids[start:end], changed).any(axis=1)
+    affected[changed[changed < old_n]] = True
+    return np.flatnonzero(affected)
+
+
+def refresh_table(index, vectors, ids, scores, changed_rows=(), nprobe=ann_index.NPROBE, ef_search=ann_index.EF_SEARCH):
+    """Rebuild only the affected rows of an existing table and append rows for new vectors"""
+    old_n, k = ids.shape
+    n = len(vectors)
+    stale = rows_to_refresh(vectors, ids, scores, changed_rows)
+    rows = np.concatenate([stale, np.arange(old_n, n)]).astype("int64")
+
+    new_ids = np.full((n, k), -1, dtype="int32")
+    new_scores = np.zeros((n, k), dtype="float16")
+    new_ids[:old_n] = ids
+    new_scores[:old_n] = scores
+    if len(rows):
+        new_ids[rows], new_scores[rows] = search_rows(index, vectors, rows, k, nprobe=nprobe, ef_search=ef_search)
+    return new_ids, new_scores, len(stale)
+
+
+def save(index_path, ids, scores):
+    ids_path, scores_path = neighbor_paths(index_path)
+    save_npy_atomic(ids_path, ids)
+    save_npy_atomic(scores_path, scores)
+
+
+def load(index_path):
+    """Memory-mapped (ids, scores) table for an index, or None if it hasn't been built"""
+    ids_path, scores_path = neighbor_paths(index_path)
+    if not (os.path.exists(ids_path) and os.path.exists(scores_path)):
+        return None
+    return np.load(ids_path, mmap_mode="r"), np.load(scores_path, mmap_mode="r")
+
+
+if __name__ == "__main__":
+    # Rebuild the table for an existing index, or --refresh it after rows were appended
+    from embeddings import BACKEND, BACKENDS, build_path, build_files, live_paths
+
+    parser = argparse.ArgumentParser(description="Build the catalog nearest-neighbour table")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=BACKEND)
+    parser.add_argument("--k", type=int, default=KNN_K, help="neighbours per movie (full build only)")
+    parser.add_argument("--refresh", action="store_true", help="only rebuild rows affected by appended movies")
+    args = parser.parse_args()
+
+    index_path, vectors_path = live_paths(args.backend)[:2]
+    index = faiss.read_index(index_path)
+    vectors = np.load(vectors_path, mmap_mode="r")
+    table = load(index_path) if args.refresh else None
+
+    if table is None:
+        ids, scores = build_table(index, vectors, args.k)
+        print(f"✅ Built {ids.shape[1]} neighbours for {len(ids)} movies")
+    else:
+        ids, scores, stale = refresh_table(index, vectors, *table)
+        print(f"✅ Refreshed {stale} existing rows and added {len(ids) - len(table[0])} new ones")
+
+    path = build_path(args.backend)
+    if not os.path.isdir(path):
+        save(index_path, ids, scores)
+    else:
+        # Publish the table as a new build of hard links to the live one's files, rather than
+        # rewriting a directory a running API may be reading
+        manifest = load_manifest(index_path)
+        version = next_version(manifest, path)
+        staging = stage_build(path, version)
+        shutil.copytree(os.path.dirname(index_path), staging, copy_function=os.link, dirs_exist_ok=True)
+        staged_index = build_files(staging)[0]
+        write_json_atomic(manifest_path(staged_index), {**manifest, "version": version})
+        save(staged_index, ids, scores)
+        publish_build(path, version)
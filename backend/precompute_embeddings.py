@@ -1,18 +1,53 @@
 import os
+import argparse
 from dotenv import load_dotenv
 import json
 import faiss
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
-from openai import OpenAI
+from embeddings import BACKEND, BACKENDS, get_backend, build_path, build_files, live_paths
+import embed_pipeline
+from embed_pipeline import EmbeddingPipeline, RateLimiter
+from catalog import Catalog, write_catalog
+from ann_index import INDEX_TYPES, build_index, recall_report, add_rows, remove_rows
+import neighbors
+from manifest import content_hash, load_manifest, manifest_path, next_version, stage_build, publish_build
 
 load_dotenv() 
 
 # --- Config ---
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-MODEL = "text-embedding-3-small"
-BATCH_SIZE = 100  # adjust if you hit rate limits
+parser = argparse.ArgumentParser(description="Embed movie_dataset.json and build the FAISS index")
+parser.add_argument("--backend", choices=sorted(BACKENDS), default=BACKEND, help="embedding backend (default: EMBEDDING_BACKEND or openai)")
+parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="FAISS index type (default: flat)")
+parser.add_argument("--nlist", type=int, default=1024, help="IVF: number of inverted lists")
+parser.add_argument("--pq-m", type=int, default=16, help="IVF-PQ: sub-quantizers per vector")
+parser.add_argument("--pq-bits", type=int, default=8, help="IVF-PQ: bits per sub-quantizer code")
+parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW: neighbours per node")
+parser.add_argument("--ef-construction", type=int, default=200, help="HNSW: build-time search depth")
+parser.add_argument("--knn-k", type=int, default=neighbors.KNN_K, help="neighbours per movie in the precomputed table (0 to skip)")
+parser.add_argument("--incremental", action="store_true", help="embed only new or changed movies and append them to the existing index")
+parser.add_argument("--concurrency", type=int, default=embed_pipeline.EMBED_CONCURRENCY, help="embedding batches in flight")
+parser.add_argument("--rpm", type=int, default=embed_pipeline.EMBED_RPM, help="embedding requests per minute budget")
+parser.add_argument("--tpm", type=int, default=embed_pipeline.EMBED_TPM, help="embedding tokens per minute budget")
+parser.add_argument("--retry-quarantined", action="store_true", help="send texts the API rejected on earlier runs again")
+parser.add_argument("--batch-size", type=int, default=embed_pipeline.EMBED_BATCH_SIZE, help="texts per embedding request")
+args = parser.parse_args()
+
+# The pipeline does its own backoff on 429s, so the OpenAI client shouldn't retry underneath it
+backend = get_backend(args.backend, **({"max_retries": 0} if args.backend == "openai" else {}))
+BUILD_PATH = build_path(args.backend)
+# The live build's files, which an incremental build reads and extends
+INDEX_PATH, VECTORS_PATH, CATALOG_PATH, LOOKUP_PATH = live_paths(args.backend)
+# Concurrent, rate-limited, checkpointed embedding: rerunning after a crash resumes, and
+# texts the API rejects are written to embedding_quarantine.jsonl instead of aborting
+pipeline = EmbeddingPipeline(
+    backend,
+    concurrency=args.concurrency,
+    limiter=RateLimiter(rpm=args.rpm, tpm=args.tpm),
+    batch_size=args.batch_size,
+)
+if args.retry_quarantined:
+    print(f"🔹 Retrying {pipeline.release_quarantine()} quarantined texts")
 alpha, beta = 0.6, 0.4
 
 # --- Load Movie Data ---
@@ -21,28 +56,9 @@ with open('movie_dataset.json', 'r') as f:
 
 movies = pd.DataFrame.from_dict(data, orient='index')
 
-# --- Helper: Batch Embedding ---
-def get_embeddings(texts, batch_size=100):
-    embeddings = []
-    for i in tqdm(range(0, len(texts), batch_size)):
-        batch = texts[i : i + batch_size]
-        batch = [t if isinstance(t, str) else str(t) for t in batch]
-        try:
-            response = client.embeddings.create(model=MODEL, input=batch)
-            embeddings.extend([d.embedding for d in response.data])
-        except Exception as e:
-            print(f"\n❌ Error in batch {i//batch_size} (items {i}-{i+len(batch)-1})")
-            print("Checking each item individually...")
-            for j, item in enumerate(batch):
-                try:
-                    client.embeddings.create(model=MODEL, input=[item])
-                except Exception as sub_e:
-                    print(f"  🔸 Failed on index {i+j}: {repr(item)[:500]}")
-                    print("  Type:", type(item))
-                    print("  Length:", len(item))
-                    raise sub_e
-            raise e
-    return np.array(embeddings)
+# --- Helper: Title Normalization (must match model.normalize_title) ---
+def normalize_title(title):
+    return " ".join(str(title).split()).casefold()
 
 # --- Prepare Text Fields ---
 overview_texts = (
@@ -69,25 +85,163 @@ feature_texts = (
 
 feature_texts = [t if t else "No features available" for t in feature_texts]
 
-# --- Get embeddings from OpenAI ---
-print("🔹 Embedding overviews...")
-overview_embeddings = get_embeddings(overview_texts)
+# --- Content hashes: a movie is re-embedded only when one of these changes ---
+movie_ids = [str(m) for m in (movies["id"] if "id" in movies.columns else movies.index)]
+records = movies.assign(id=movie_ids).to_dict(orient="records")
+hashes = [
+    content_hash(backend.model_name, overview, feature, record)
+    for overview, feature, record in zip(overview_texts, feature_texts, records)
+]
+
+def embed_movies(positions):
+    """Combined, normalized vectors for the dataset positions that embedded cleanly, and those positions.
+
+    A movie with a quarantined overview or metadata text is left out of this build and its
+    manifest. Later --incremental runs skip it until its text changes or --retry-quarantined
+    is passed, so it doesn't force a new build every run.
+    """
+    positions = list(positions)
+    print(f"🔹 Embedding overviews and metadata for {len(positions)} movies...")
+    embeddings, failed = pipeline.embed(
+        [overview_texts[i] for i in positions] + [feature_texts[i] for i in positions]
+    )
+    n = len(positions)
+    failed = {i % n for i in failed}
+    ok = [j for j in range(n) if j not in failed]
+    if failed:
+        print(f"⚠️ Skipping {len(failed)} movies with quarantined texts, see {pipeline.quarantine_path}")
+    print(f"  {pipeline.stats()}")
+
+    # --- Combine both sets ---
+    overview_embeddings = embeddings[:n][ok]
+    feature_embeddings = embeddings[n:][ok]
+    combined = alpha * overview_embeddings + beta * feature_embeddings
+    combined = combined.astype("float32")
+    faiss.normalize_L2(combined)
+    return combined, [positions[j] for j in ok]
+
+# The live build, if any; a full build still continues its version count, so a running
+# API sees the rebuilt index as new and reloads it
+existing = load_manifest(INDEX_PATH)
+previous = existing if args.incremental else None
+if args.incremental and previous is None:
+    print("⚠️ No manifest for this index yet, doing a full build")
+if previous is not None and previous["model"] != backend.model_name:
+    raise SystemExit(f"❌ Index was built with {previous['model']}, run a full build to switch to {backend.model_name}")
+
+if previous is None:
+    # --- Full build ---
+    all_vectors, kept = embed_movies(range(len(movies)))
+    index = build_index(
+        all_vectors,
+        index_type=args.index_type,
+        nlist=args.nlist,
+        pq_m=args.pq_m,
+        pq_bits=args.pq_bits,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction,
+    )
+
+    # --- Recall@k vs latency against the flat baseline ---
+    if args.index_type != "flat":
+        print(f"🔹 Measuring {args.index_type} recall@50 against flat search...")
+        report = recall_report(index, all_vectors)
+        for row in report:
+            print(f"  {row['config']:>14}  recall@50={row['recall']:.3f}  {row['ms_per_query']:.3f} ms/query")
+        with open("index_report.json", "w") as f:
+            json.dump({"index_type": args.index_type, "params": vars(args), "report": report}, f, indent=2)
+
+    rows = [[movie_ids[pos], hashes[pos]] for pos in kept]
+    catalog_records = [records[pos] for pos in kept]
+    tombstoned = []
+    old_rows = 0
+else:
+    # --- Incremental build: diff against the manifest, append new versions, tombstone old ones ---
+    rows = previous["rows"]
+    old_rows = len(rows)
+    live = {row[0]: (r, row[1]) for r, row in enumerate(rows) if row is not None}
+    latest = {movie_id: pos for pos, movie_id in enumerate(movie_ids)}
+
+    changed = [pos for movie_id, pos in latest.items() if live.get(movie_id, (None, None))[1] != hashes[pos]]
+    to_embed = [pos for pos in changed if not pipeline.is_quarantined(overview_texts[pos], feature_texts[pos])]
+    removed = [r for movie_id, (r, _) in live.items() if movie_id not in latest]
+    print(f"🔹 {len(to_embed)} new or changed movies, {len(removed)} removed")
+    if len(to_embed) < len(changed):
+        print(f"  skipping {len(changed) - len(to_embed)} quarantined movies (--retry-quarantined to send them again)")
+    if not to_embed and not removed:
+        raise SystemExit("✅ Index is up to date")
+
+    old_catalog = Catalog.open(os.path.realpath(CATALOG_PATH))
+    if len(old_catalog) != len(rows):
+        raise SystemExit(f"❌ {CATALOG_PATH} doesn't match the manifest, run a full build")
+
+    index = faiss.read_index(INDEX_PATH)
+    new_vectors, to_embed = embed_movies(to_embed) if to_embed else (np.zeros((0, index.d), dtype="float32"), [])
+    if not to_embed and not removed:
+        raise SystemExit("✅ Index is up to date, every new or changed movie was quarantined")
+    # A changed movie keeps its old row unless its new version embedded
+    tombstoned = [live[movie_ids[pos]][0] for pos in to_embed if movie_ids[pos] in live] + removed
+    add_rows(index, new_vectors, np.arange(len(rows), len(rows) + len(to_embed)))
+    if tombstoned and not remove_rows(index, tombstoned):
+        print("  (HNSW can't remove vectors; tombstoned rows are masked at query time)")
+
+    all_vectors = np.concatenate([np.load(VECTORS_PATH, mmap_mode="r"), new_vectors])
+    for r in tombstoned:
+        rows[r] = None
+    rows += [[movie_ids[pos], hashes[pos]] for pos in to_embed]
+    catalog_records = [old_catalog.row(i) for i in range(len(old_catalog))] + [records[pos] for pos in to_embed]
+
+version = next_version(existing, BUILD_PATH)
+
+# Everything below is written into a fresh `<build>.v<version>` directory, which is published
+# by flipping one symlink, so a running API (model.watch_builds) only ever loads a complete
+# build and never mixes files from two.
+staging = stage_build(BUILD_PATH, version)
+index_path, vectors_path, catalog_path, lookup_path = build_files(staging)
+
+# Sidecar copy of the stored vectors so catalog movies can be searched without re-embedding
+np.save(vectors_path, all_vectors)
+
+# --- Save FAISS Index ---
+faiss.write_index(index, index_path)
+
+# --- Precomputed neighbour table, so /recommend answers catalog movies with a row lookup ---
+if args.knn_k:
+    table = neighbors.load(INDEX_PATH) if previous is not None else None
+    if table is not None and table[0].shape == (old_rows, args.knn_k):
+        print("🔹 Refreshing neighbours of affected movies...")
+        knn_ids, knn_scores, stale = neighbors.refresh_table(
+            index, all_vectors, np.array(table[0]), np.array(table[1]), changed_rows=tombstoned
+        )
+        print(f"  rebuilt {stale} existing rows")
+    else:
+        print(f"🔹 Computing top-{args.knn_k} neighbours for every movie...")
+        knn_ids, knn_scores = neighbors.build_table(index, all_vectors, args.knn_k)
+    neighbors.save(index_path, knn_ids, knn_scores)
+
+# --- Save memory-mappable catalog (row-aligned with the index) ---
+write_catalog(catalog_path, catalog_records)
+
+# --- Save movie data (the JSON export is only row-aligned after a full build) ---
+if previous is None:
+    movies.iloc[kept].to_json("movies_precomputed.json", orient="index")
 
-print("🔹 Embedding metadata...")
-feature_embeddings = get_embeddings(feature_texts)
+# --- Save title -> TMDB id and id -> row lookups for live rows ---
+title_to_id = {}
+id_to_row = {}
+for row, entry in enumerate(rows):
+    if entry is None:
+        continue
+    id_to_row[entry[0]] = row
+    title_to_id.setdefault(normalize_title(catalog_records[row]["title"]), entry[0])
 
-# --- Combine both sets ---
-combined_embeddings = alpha * overview_embeddings + beta * feature_embeddings
-combined_embeddings = combined_embeddings.astype("float32")  
-faiss.normalize_L2(combined_embeddings)
+with open(lookup_path, "w") as f:
+    json.dump({"title_to_id": title_to_id, "id_to_row": id_to_row}, f)
 
-# --- Build & Save FAISS Index ---
-dim = combined_embeddings.shape[1]
-index = faiss.IndexFlatIP(dim)
-index.add(combined_embeddings)
-faiss.write_index(index, "movie_index.faiss")
+with open(manifest_path(index_path), "w") as f:
+    json.dump({"version": version, "model": backend.model_name, "rows": rows}, f)
 
-# --- Save movie data ---
-movies.to_json("movies_precomputed.json", orient="index")
+# --- Publish: the build is live for hot-swapping once the symlink points at it ---
+publish_build(BUILD_PATH, version)
 
-print("✅ Done! Saved FAISS index and movie data using OpenAI embeddings.")
+print(f"✅ Done! Published {BUILD_PATH}.v{version} using {backend.model_name} embeddings.")
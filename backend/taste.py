@@ -0,0 +1,176 @@
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+import model
+from db import connection
+
+# --- Config ---
+# Ratings are 0-10; only ratings at or above this pull the taste vector towards a movie
+LIKE_THRESHOLD = float(os.getenv("TASTE_LIKE_THRESHOLD", 6))
+WATCHLIST_WEIGHT = float(os.getenv("TASTE_WATCHLIST_WEIGHT", 5))
+FAVORITE_WEIGHT = float(os.getenv("TASTE_FAVORITE_WEIGHT", 10))
+TASTE_CACHE_SIZE = int(os.getenv("TASTE_CACHE_SIZE", 10000))
+# Bounds staleness from writes handled by other workers (and favourites edits)
+TASTE_CACHE_TTL = int(os.getenv("TASTE_CACHE_TTL", 10 * 60))
+
+# Every movie a user has rated, watchlisted or picked as a favourite, one row per source
+TASTE_SOURCES_SQL = """
+SELECT 'rating', movie_id::text, rating FROM ratings WHERE user_id=%(user)s
+UNION ALL
+SELECT 'watchlist', movie_id::text, NULL FROM watchlist WHERE user_id=%(user)s AND movie_id IS NOT NULL
+UNION ALL
+SELECT 'favorite', fav->>'id', NULL
+  FROM users, jsonb_array_elements(COALESCE(fav_movies::jsonb, '[]'::jsonb)) fav
+ WHERE users.id=%(user)s AND jsonb_typeof(fav) = 'object'
+"""
+
+
+def rating_weight(rating):
+    return float(rating) if rating is not None and rating >= LIKE_THRESHOLD else 0.0
+
+
+class TasteProfile:
+    """Running weighted sum of catalog vectors, so one write is an O(d) update"""
+
+    def __init__(self):
+        self.weights = {}
+        self.seen = set()
+        self.total = 0.0
+        self.sum = None
+        self.created = time.monotonic()
+
+    def set_weight(self, source, movie_id, weight):
+        movie_id = str(movie_id)
+        self.seen.add(movie_id)
+        build = model.current
+        row = model.lookup_row(movie_id, build)
+        if row is None:
+            return
+
+        delta = weight - self.weights.get((source, movie_id), 0.0)
+        if weight:
+            self.weights[(source, movie_id)] = weight
+        else:
+            self.weights.pop((source, movie_id), None)
+        if not delta:
+            return
+
+        vec = model.stored_vector(row, build)
+        if self.sum is None:
+            self.sum = np.zeros_like(vec)
+        self.sum += delta * vec
+        self.total += delta
+
+    def vector(self):
+        """Unit-length taste vector for inner-product search, or None before any liked movie"""
+        if self.sum is None or self.total <= 0:
+            return None
+        norm = np.linalg.norm(self.sum)
+        return self.sum / norm if norm else None
+
+    def seen_rows(self, build=None):
+        rows = (model.lookup_row(movie_id, build) for movie_id in self.seen)
+        return [row for row in rows if row is not None]
+
+    def snapshot(self):
+        """(taste vector, seen rows, build they index) as new objects. Writes update the profile
+        in place on the event loop, so take this there before handing the search to another thread."""
+        build = model.current
+        return self.vector(), self.seen_rows(build), build
+
+
+class TasteCache:
+    """TTL + LRU cache of taste profiles keyed by user id"""
+
+    def __init__(self, maxsize=TASTE_CACHE_SIZE, ttl=TASTE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        profile = self.entries.get(user_id)
+        if profile is None or time.monotonic() - profile.created > self.ttl:
+            self.entries.pop(user_id, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return profile
+
+    def set(self, user_id, profile):
+        self.entries[user_id] = profile
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self.entries.pop(user_id, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+cache = TasteCache()
+
+
+async def load_profile(conn, user_id):
+    async with conn.cursor() as cur:
+        await cur.execute(TASTE_SOURCES_SQL, {"user": user_id})
+        rows = await cur.fetchall()
+
+    profile = TasteProfile()
+    for source, movie_id, rating in rows:
+        if movie_id is None:
+            continue
+        if source == "rating":
+            weight = rating_weight(rating)
+        elif source == "watchlist":
+            weight = WATCHLIST_WEIGHT
+        else:
+            weight = FAVORITE_WEIGHT
+        profile.set_weight(source, movie_id, weight)
+    return profile
+
+
+async def get_profile(user_id):
+    """Cached taste profile, built from the user's ratings, watchlist and favourites on a miss.
+    Only a miss checks out a pooled connection, and only for the query."""
+    profile = cache.get(user_id)
+    if profile is None:
+        async with connection() as conn:
+            profile = await load_profile(conn, user_id)
+            await conn.commit()
+        cache.set(user_id, profile)
+    return profile
+
+
+def record_rating(user_id, movie_id, rating):
+    # Uncached users are rebuilt from the database on their next read, nothing to update
+    profile = cache.entries.get(user_id)
+    if profile is not None:
+        profile.set_weight("rating", movie_id, rating_weight(rating))
+
+
+def record_watchlist(user_id, movie_id):
+    profile = cache.entries.get(user_id)
+    if profile is not None and movie_id is not None:
+        profile.set_weight("watchlist", movie_id, WATCHLIST_WEIGHT)
+
+
+def invalidate(user_id):
+    cache.invalidate(user_id)
+
+
+def recommend(vec, seen_rows, top_k=20, build=None):
+    """One FAISS search from a profile snapshot's taste vector, skipping everything already seen"""
+    return model.search_batch(vec[None, :], top_k, exclude=seen_rows, build=build)[0]
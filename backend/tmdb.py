@@ -0,0 +1,177 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlencode
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Config ---
+API_TOKEN = os.getenv("API_TOKEN")
+BASE_URL = "https://api.themoviedb.org/3"
+CACHE_SIZE = int(os.getenv("TMDB_CACHE_SIZE", 2048))
+MAX_CONNECTIONS = int(os.getenv("TMDB_MAX_CONNECTIONS", 50))
+MAX_KEEPALIVE = int(os.getenv("TMDB_MAX_KEEPALIVE", 20))
+
+# TTL (seconds) per endpoint family, first matching prefix wins
+TTLS = [
+    ("genre/", 24 * 60 * 60),
+    ("movie/now_playing", 5 * 60),
+    ("movie/popular", 5 * 60),
+    ("movie/top_rated", 60 * 60),
+    ("discover/movie", 30 * 60),
+    ("search/movie", 60 * 60),
+    ("movie/", 24 * 60 * 60),
+]
+DEFAULT_TTL = 5 * 60
+
+
+def ttl_for(path):
+    for prefix, ttl in TTLS:
+        if path.startswith(prefix):
+            return ttl
+    return DEFAULT_TTL
+
+
+class ResponseCache:
+    """TTL + LRU cache of decoded TMDB responses keyed by URL"""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires, value = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+cache = ResponseCache()
+_client = None
+_inflight = {}
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_client():
+    """App-lifetime client so keep-alive connections are reused across requests"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            headers={"Authorization": f"Bearer {API_TOKEN}"},
+            timeout=10.0,
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def cache_key(path, params):
+    query = urlencode(sorted(params.items())) if params else ""
+    return f"{BASE_URL}/{path}?{query}" if query else f"{BASE_URL}/{path}"
+
+
+async def _fetch(path, params):
+    response = await get_client().get(f"/{path}", params=params)
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+
+async def _fetch_and_cache(key, path, params, ttl):
+    data = await _fetch(path, params)
+    if data is not None:
+        cache.set(key, data, ttl if ttl is not None else ttl_for(path))
+    return data
+
+
+def _fetch_done(key, task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Mark the exception retrieved even if every waiter was cancelled before it landed
+    if not task.cancelled():
+        task.exception()
+
+
+async def get(path, params=None, ttl=None, fresh=False):
+    """GET a TMDB path and return the decoded JSON, or None on a non-200 response.
+
+    Successful responses are cached; concurrent misses for the same URL share one request.
+    fresh=True skips the cache read (the result is still cached).
+    """
+    path = path.lstrip("/")
+    params = {k: v for k, v in (params or {}).items() if v is not None}
+    key = cache_key(path, params)
+
+    cached = None if fresh else cache.get(key)
+    if cached is not None:
+        return cached
+
+    pending = _inflight.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(_fetch_and_cache(key, path, params, ttl))
+        pending.add_done_callback(lambda task: _fetch_done(key, task))
+        _inflight[key] = pending
+
+    # The shared fetch outlives any one caller: a cancelled waiter (e.g. a wait_for
+    # deadline) must not cancel it for everyone else coalesced onto it
+    return await asyncio.shield(pending)
+
+
+def stats():
+    return {
+        "cache": cache.stats(),
+        "http2": _http2_available(),
+        "inflight": len(_inflight),
+    }
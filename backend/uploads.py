@@ -0,0 +1,134 @@
+import io
+import os
+import json
+import uuid
+import asyncio
+import logging
+from boto3.s3.transfer import TransferConfig
+from PIL import Image, ImageOps
+from werkzeug.utils import secure_filename
+import executors
+from db import pool, s3, BUCKET, S3_ENDPOINT_URL
+
+# --- Config ---
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+PRESIGN_EXPIRES = int(os.getenv("PRESIGN_EXPIRES", 600))
+ALLOWED_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+
+# Longest edge in pixels for each variant served by /fetch_profile_pic
+VARIANTS = {"thumb": 128, "medium": 512}
+
+# Files over 8 MB go up in parallel multipart chunks
+transfer_config = TransferConfig(multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024)
+
+queue = asyncio.Queue()
+_worker = None
+processed = {"done": 0, "failed": 0}
+
+
+def object_url(key):
+    if S3_ENDPOINT_URL:
+        return f"{S3_ENDPOINT_URL.rstrip('/')}/{BUCKET}/{key}"
+    return f"https://{BUCKET}.s3.amazonaws.com/{key}"
+
+
+def user_prefix(username):
+    return f"profile_pics/{secure_filename(username)}/"
+
+
+def new_key(username, filename):
+    stem, ext = os.path.splitext(secure_filename(filename or "") or "upload")
+    return f"{user_prefix(username)}{uuid.uuid4().hex}{ext.lower()}"
+
+
+def presign_upload(username, filename, content_type):
+    """Presigned POST so the browser uploads straight to S3, bounded in size and type"""
+    key = new_key(username, filename)
+    post = s3.generate_presigned_post(
+        BUCKET,
+        key,
+        Fields={"Content-Type": content_type},
+        Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, MAX_UPLOAD_BYTES]],
+        ExpiresIn=PRESIGN_EXPIRES,
+    )
+    return {"url": post["url"], "fields": post["fields"], "key": key}
+
+
+async def upload_stream(fileobj, username, filename, content_type=None):
+    """Stream an UploadFile's spooled body to S3 (multipart for large files) off the event loop"""
+    key = new_key(username, filename)
+    extra = {"ContentType": content_type} if content_type else None
+    await executors.io.run(
+        lambda: s3.upload_fileobj(fileobj, BUCKET, key, ExtraArgs=extra, Config=transfer_config)
+    )
+    return key
+
+
+def _make_variants(key):
+    """Download the original, write a bounded JPEG per variant, return {variant: url}"""
+    original = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(original)))
+    image = image.convert("RGB")
+
+    stem = os.path.splitext(key)[0]
+    urls = {}
+    for name, edge in VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail((edge, edge))
+        body = io.BytesIO()
+        variant.save(body, format="JPEG", quality=85, optimize=True)
+        variant_key = f"{stem}_{name}.jpg"
+        s3.put_object(
+            Bucket=BUCKET,
+            Key=variant_key,
+            Body=body.getvalue(),
+            ContentType="image/jpeg",
+            CacheControl="public, max-age=31536000, immutable",
+        )
+        urls[name] = object_url(variant_key)
+    return urls
+
+
+async def _process(username, key):
+    urls = await executors.io.run(_make_variants, key)
+    async with pool.connection() as conn:
+        # Only record variants if the user hasn't uploaded a newer picture in the meantime
+        await conn.execute(
+            "UPDATE users SET profile_pic_variants=%s WHERE username=%s AND profile_pic=%s",
+            (json.dumps(urls), username, object_url(key)),
+        )
+
+
+async def worker():
+    while True:
+        username, key = await queue.get()
+        try:
+            await _process(username, key)
+            processed["done"] += 1
+        except Exception as e:
+            processed["failed"] += 1
+            logging.error(f"Error creating profile picture variants for {key}: {e}")
+        finally:
+            queue.task_done()
+
+
+def enqueue_variants(username, key):
+    queue.put_nowait((username, key))
+
+
+def start():
+    global _worker
+    _worker = asyncio.create_task(worker())
+
+
+async def stop():
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+
+
+def stats():
+    return {"queued": queue.qsize(), **processed}
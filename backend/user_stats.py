@@ -0,0 +1,39 @@
+import model
+import tmdb
+
+# Everything the profile page shows, aggregated in Postgres so only one row comes back
+USER_STATS_SQL = """
+SELECT COUNT(*),
+       COALESCE(MAX(rating), 0),
+       COALESCE(AVG(rating), 0),
+       (ARRAY_AGG(movie_id ORDER BY rating DESC))[1],
+       (SELECT json_object_agg(rating, n ORDER BY rating)
+          FROM (SELECT rating, COUNT(*) AS n FROM ratings WHERE user_id=%(user)s GROUP BY rating) histogram)
+FROM ratings WHERE user_id=%(user)s
+"""
+
+
+async def movie_title(movie_id):
+    """Title from the local catalog, falling back to the cached TMDB client for off-catalog movies"""
+    title = model.title_for_id(movie_id)
+    if title is not None:
+        return title
+
+    data = await tmdb.get(f"movie/{movie_id}")
+    return data.get("title", "Unknown Title") if data else "Unknown Title"
+
+
+async def fetch_user_stats(conn, user_id):
+    """The aggregate row, with the top movie as an id: resolve it with movie_title once the
+    connection is back in the pool, since that can wait on TMDB"""
+    async with conn.cursor() as cur:
+        await cur.execute(USER_STATS_SQL, {"user": user_id})
+        count, max_rating, avg_rating, top_movie_id, histogram = await cur.fetchone()
+
+    return {
+        "count": count,
+        "max_rating": max_rating,
+        "avg_rating": float(avg_rating),
+        "top_movie_id": top_movie_id if max_rating > 0 else None,
+        "histogram": histogram or {},
+    }
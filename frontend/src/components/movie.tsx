@@ -41,6 +41,7 @@ function Movie() {
   const [data, setData] = useState<dataProps[]>([]);
   const [comment, setComment] = useState<string>("");
   const [comments, setComments] = useState<commentsProps[]>([]); // Array to hold comments
+  const [nextCursor, setNextCursor] = useState<string | null>(null); // Cursor for the next page of comments
   const [user, setUser] = useState<string>("");
   const [watchlist, setWatchlist] = useState(false); // To toggle between add/remove buttons
   const [avgRating, setAvgRating] = useState(0); // To hold avg rating
@@ -165,9 +166,11 @@ function Movie() {
     }
   };
 
-  const fetchComments = async () => {
+  const fetchComments = async (cursor: string | null = null) => {
     try {
-      const url = `https://api.popcornpick.app/fetch_comments?movie_id=${id}`;
+      const url =
+        `https://api.popcornpick.app/fetch_comments?movie_id=${id}` +
+        (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "");
       const resp = await fetch(url, { credentials: "include" });
 
       if (!resp.ok) {
@@ -176,7 +179,10 @@ function Movie() {
 
       const data = await resp.json();
       setUser(data.user);
-      setComments(data.comments);
+      setComments((prevComments) =>
+        cursor ? [...prevComments, ...data.comments] : data.comments
+      );
+      setNextCursor(data.next_cursor);
       console.log("Comments fetched:", data.comments);
     } catch (err) {
       console.error("Fetch error:", err);
@@ -200,22 +206,6 @@ function Movie() {
     }
   };
 
-  const updateAvgRating = async () => {
-    try {
-      const url = `https://api.popcornpick.app/update_avg_rating?movie_id=${id}`;
-      const resp = await fetch(url, { credentials: "include" });
-
-      if (!resp.ok) {
-        throw new Error(`HTTP error! status: ${resp.status}`);
-      }
-
-      const data = await resp.json();
-      console.log("User rating updated:", data.message);
-    } catch (err) {
-      console.error("Fetch error:", err);
-    }
-  };
-
   // API call to Fetch Movie Ratings
   const fetchRating = async () => {
     try {
@@ -262,7 +252,6 @@ function Movie() {
 
   const handleRating = (newRating: Number) => {
     updateUserRating(newRating);
-    updateAvgRating();
   };
 
   return (
@@ -452,6 +441,14 @@ function Movie() {
                   </p>
                 </div>
               ))}
+              {nextCursor && (
+                <button
+                  onClick={() => fetchComments(nextCursor)}
+                  className="text-indigo-400 hover:text-indigo-300 text-sm transition"
+                >
+                  Load more comments
+                </button>
+              )}
             </div>
           )}
         </div>
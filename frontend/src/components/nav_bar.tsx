@@ -32,7 +32,7 @@ function NavBar({ setRecs }: NavBarProps) {
 
   const fetchUpload = async () => {
     try {
-      const url = `https://api.popcornpick.app/fetch_profile_pic`;
+      const url = `https://api.popcornpick.app/fetch_profile_pic?size=thumb`;
       const resp = await fetch(url, { credentials: "include" });
 
       if (!resp.ok) {
@@ -56,7 +56,7 @@ function Profile() {
 
   const fetchUpload = async () => {
     try {
-      const url = `https://api.popcornpick.app/fetch_profile_pic`;
+      const url = `https://api.popcornpick.app/fetch_profile_pic?size=medium`;
       const resp = await fetch(url, { credentials: "include" });
 
       if (!resp.ok) {